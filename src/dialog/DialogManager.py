@@ -87,10 +87,11 @@ class DialogManager:
     def end_dialog(self):
         """
             ends the dialog by closing the dialog, and the session
-            closes the face recogniser
+            closes the face recogniser and the memory
         """
         self.dialog.end()
         self.face_recogniser.close()
+        self.memory.close()
 
     def get_intent(self, text:str) -> Intent | None:
         """
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import zipfile
+
+import numpy
+from numpy._typing import NDArray
+
+from memory.questionbank import QuestionBank
+from utils.topic_model import TopicModel
+
+
+class CueCardTopics:
+    """
+    Precomputed table of cue card id -> (keywords, dominant topic, topic distribution).
+    The table is built once from the question bank and the topic model, stored on
+    disk next to the model and rebuilt whenever either of them changes. The stored
+    table is replaced atomically, as processes sharing the model may read it while
+    it is rebuilt.
+    """
+
+    # Bump when the way keywords or topics are computed changes
+    VERSION = 3
+
+    def __init__(
+        self,
+        question_bank: QuestionBank,
+        topic_model: TopicModel,
+        path: str | None = None,
+    ) -> None:
+        self.question_bank = question_bank
+        self.topic_model = topic_model
+        # Stored next to the model by default, one table per model
+        self.path = path if path is not None else topic_model.path + ".cue_cards.npz"
+
+        self._fingerprint: NDArray | None = None
+        self._keywords: list[list[str]] = []
+        self._topics: NDArray = numpy.empty(0, dtype=numpy.int32)
+        self._distributions: NDArray = numpy.empty((0, 0), dtype=numpy.float32)
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._keywords)
+
+    def keywords(self, _id: int) -> list[str]:
+        self._refresh()
+        return self._keywords[_id]
+
+    def topic(self, _id: int) -> int:
+        """Returns the dominant topic of the cue card"""
+        self._refresh()
+        return int(self._topics[_id])
+
+    def distribution(self, _id: int) -> NDArray:
+        """Returns the topic distribution of the cue card (read-only)"""
+        self._refresh()
+        return self._distributions[_id]
+
+    def lookup(self, _id: int) -> tuple[list[str], int, NDArray]:
+        self._refresh()
+        return self._keywords[_id], int(self._topics[_id]), self._distributions[_id]
+
+    def fingerprint(self) -> NDArray:
+        """Identifies the inputs of the table, a different fingerprint invalidates it"""
+        model = os.stat(self.topic_model.path)
+        return numpy.array(
+            [
+                self.VERSION,
+                *self.question_bank.fingerprint,
+                model.st_mtime_ns,
+                model.st_size,
+            ],
+            dtype=numpy.int64,
+        )
+
+    def build(self) -> None:
+        """Computes the table for every cue card in the question bank and stores it"""
+        fingerprint = self.fingerprint()
+        keywords = [TopicModel.preprocess(card) for card in self.question_bank.cards]
+        distributions = self.topic_model.get_topic_matrix(keywords)
+
+        self._set(fingerprint, keywords, distributions.argmax(axis=1), distributions)
+        self._save()
+
+    def _refresh(self) -> None:
+        fingerprint = self.fingerprint()
+
+        if self._fingerprint is not None and numpy.array_equal(
+            fingerprint, self._fingerprint
+        ):
+            return
+
+        if not self._load(fingerprint):
+            self.build()
+
+    def _set(
+        self,
+        fingerprint: NDArray,
+        keywords: list[list[str]],
+        topics: NDArray,
+        distributions: NDArray,
+    ) -> None:
+        distributions.setflags(write=False)
+
+        self._fingerprint = fingerprint
+        self._keywords = keywords
+        self._topics = topics.astype(numpy.int32)
+        self._distributions = distributions
+
+    def _load(self, fingerprint: NDArray) -> bool:
+        """Loads the stored table, returns False if it is missing, outdated or corrupt"""
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with numpy.load(self.path, allow_pickle=False) as table:
+                if not numpy.array_equal(table["fingerprint"], fingerprint):
+                    return False
+
+                keywords = [str(words).split() for words in table["keywords"]]
+                topics, distributions = table["topics"], table["distributions"]
+        except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile):
+            return False
+
+        self._set(fingerprint, keywords, topics, distributions)
+        return True
+
+    def _save(self) -> None:
+        assert self._fingerprint is not None
+
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, temporary = tempfile.mkstemp(prefix=name + ".", dir=directory)
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                numpy.savez(
+                    f,
+                    fingerprint=self._fingerprint,
+                    keywords=numpy.array(
+                        [" ".join(words) for words in self._keywords],
+                        dtype=numpy.str_,
+                    ),
+                    topics=self._topics,
+                    distributions=self._distributions,
+                )
+
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.remove(temporary)
+            raise
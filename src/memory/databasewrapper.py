@@ -1,18 +1,30 @@
 from __future__ import annotations
 
-import pickle
 import time
-import face_recognition
 import numpy
 
 from numpy._typing import NDArray
-import pandas as pd
-
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient
 from pymongo.cursor import Cursor
-from spacy.tokens.doc import Doc
-
-from utils.topic_model import TopicModel
+from pymongo.errors import BulkWriteError
+
+from memory.encoding import (
+    MISSING_WORD,
+    Vocabulary,
+    decode_face_encodings,
+    decode_float32,
+    decode_tokens,
+    encode_face_encodings,
+    encode_float32,
+    encode_tokens,
+)
+from memory.faceindex import FaceIndex
+from memory.questionbank import QuestionBank
+from memory.writebehind import PartialWriteException, WriteBehindQueue
+from utils.latency import timed
+from utils.level_logging import CustomFormatter
+
+logger = CustomFormatter.init_logger(__name__)
 
 
 class Storable:
@@ -48,7 +60,7 @@ class User(Storable):
 
     def __init__(self, name: str, encodings: NDArray, _id: int | None = None) -> None:
         self.name: str = name
-        self.face_encodings: NDArray = encodings
+        self.face_encodings: NDArray = numpy.asarray(encodings, dtype=numpy.float32)
 
         self._id: int = _id if _id is not None else hash(self)
 
@@ -56,12 +68,14 @@ class User(Storable):
         return {
             "_id": self._id,
             "name": self.name,
-            "face_encodings": pickle.dumps(self.face_encodings),
+            "face_encodings": encode_face_encodings(self.face_encodings),
         }
 
     @staticmethod
     def _from_mongo_obj(obj: dict) -> "User":
-        return User(obj["name"], pickle.loads(obj["face_encodings"]), _id=obj["_id"])
+        return User(
+            obj["name"], decode_face_encodings(obj["face_encodings"]), _id=obj["_id"]
+        )
 
     def __str__(self) -> str:
         return self.name + str(self.face_encodings)
@@ -91,6 +105,10 @@ class Session(Storable):
         average_score: float = 0.0,
         on_topic: float = 0.0,
         over_time: bool = False,
+        utterance_count: int = 0,
+        topic_counts: dict[str, int] | None = None,
+        fluency_features: NDArray | None = None,
+        fluency_score: float | None = None,
     ) -> None:
         self.user = user
         self.start_time = start_time if start_time is not None else time.time()
@@ -100,13 +118,26 @@ class Session(Storable):
         self.average_score = average_score
         self.on_topic = on_topic
         self.over_time = over_time
+        self.utterance_count = utterance_count
+        # Number of utterances per (stringified) topic
+        self.topic_counts: dict[str, int] = (
+            topic_counts if topic_counts is not None else {}
+        )
+        # Features (see FluencyFeatures) and fluency score of all speech of the
+        # session, older sessions only have the average score of their utterances
+        self.fluency_features = fluency_features
+        self.fluency_score = fluency_score
+        # Dominant topic and topic distribution of the cue card, cached for the
+        # duration of the session (not stored)
+        self.cue_card_topic: int | None = None
+        self.cue_card_distribution: NDArray | None = None
 
         self._id = _id if _id is not None else hash(self)
 
     def _to_mongo_obj(self) -> dict:
         return {
             "_id": self._id,
-            "user": self.user._to_mongo_obj(),
+            "user": {"_id": self.user._id},
             "start_time": self.start_time,
             "end_time": self.end_time,
             "cue_card_id": self.cue_card_id,
@@ -114,13 +145,28 @@ class Session(Storable):
             "average_score": self.average_score,
             "on_topic": self.on_topic,
             "over_time": self.over_time,
+            "utterance_count": self.utterance_count,
+            "topic_counts": self.topic_counts,
+            "fluency_features": (
+                encode_float32(self.fluency_features)
+                if self.fluency_features is not None
+                else None
+            ),
+            "fluency_score": self.fluency_score,
         }
 
     @staticmethod
-    def _from_mongo_obj(obj: dict) -> "Session":
+    def _from_mongo_obj(obj: dict, user: User | None = None) -> "Session":
+        """
+        Sessions only reference their user by _id, so the user should be given.
+        Older sessions which embed the whole user can be loaded without one.
+        """
+        if user is None and "name" not in obj["user"]:
+            raise ValueError(f"Session {obj['_id']} only references its user by _id")
+
         return Session(
             _id=obj["_id"],
-            user=User._from_mongo_obj(obj["user"]),
+            user=user if user is not None else User._from_mongo_obj(obj["user"]),
             start_time=obj["start_time"],
             end_time=obj["end_time"],
             cue_card_id=obj["cue_card_id"],
@@ -128,6 +174,21 @@ class Session(Storable):
             average_score=obj["average_score"],
             on_topic=obj["on_topic"],
             over_time=obj["over_time"],
+            utterance_count=obj.get("utterance_count", 0),
+            topic_counts=obj.get("topic_counts"),
+            fluency_features=(
+                decode_float32(obj["fluency_features"])
+                if obj.get("fluency_features") is not None
+                else None
+            ),
+            fluency_score=obj.get("fluency_score"),
+        )
+
+    @property
+    def score(self) -> float:
+        """Fluency score of the session's speech"""
+        return (
+            self.fluency_score if self.fluency_score is not None else self.average_score
         )
 
     def __str__(self) -> str:
@@ -147,15 +208,153 @@ class Session(Storable):
         return hash(str(self))
 
 
+class Progress(Storable):
+    """
+    Rolling progress of a user over their most recent sessions [long-term memory].
+    Keeps the topic, score and over-time values of the last `window` sessions
+    (oldest first) together with running sums, so the progress trends can be
+    computed in constant time.
+    """
+
+    METRICS = ("topic", "score", "over_time")
+
+    def __init__(
+        self,
+        user_id: int,
+        window: int = 5,
+        entries: list[dict] | None = None,
+        sums: dict[str, list[float]] | None = None,
+    ) -> None:
+        self.user_id = user_id
+        self.window = window
+        self.entries: list[dict] = entries if entries is not None else []
+
+        # Per metric: [sum(x), sum(x^2), sum(i * x)] where i is the position in the window
+        self.sums: dict[str, list[float]] = (
+            sums if sums is not None else {m: [0.0, 0.0, 0.0] for m in self.METRICS}
+        )
+
+        self._id = user_id
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def push(self, session_id: int, topic: int, score: float, over_time: bool) -> None:
+        """Adds a session to the window, dropping the oldest one if the window is full"""
+        while len(self.entries) >= self.window:
+            self._evict()
+
+        entry = {
+            "session_id": session_id,
+            "topic": topic,
+            "score": score,
+            "over_time": over_time,
+        }
+        position = len(self.entries)
+
+        for metric, x in self._values(entry).items():
+            sums = self.sums[metric]
+            sums[0] += x
+            sums[1] += x * x
+            sums[2] += position * x
+
+        self.entries.append(entry)
+
+    def slope(self, metric: str, last: int | None = None) -> float:
+        """
+        Returns the slope of fitting the position of each session (spread over
+        [0, n] like numpy.linspace) against the metric's value, which is what
+        numpy.polyfit(values, numpy.linspace(0, n, n), 1)[0] computes.
+        If last is given (and smaller than the window) only the last sessions are used.
+        """
+        if last is None or last >= len(self.entries):
+            n = len(self.entries)
+            sum_x, sum_xx, sum_ix = self.sums[metric]
+        else:
+            n = max(last, 0)
+            values = [self._values(entry)[metric] for entry in self.entries[-n:]]
+            sum_x = sum(values)
+            sum_xx = sum(x * x for x in values)
+            sum_ix = sum(i * x for i, x in enumerate(values))
+
+        if n < 2:
+            return 0.0
+
+        scale = n / (n - 1)  # y_i = i * n / (n - 1)
+        sum_y = n * n / 2
+        sum_xy = sum_ix * scale
+        variance = n * sum_xx - sum_x * sum_x
+
+        if abs(variance) <= 1e-9 * max(1.0, n * sum_xx):
+            # All values are equal: polyfit returns the minimum-norm solution
+            x = sum_x / n
+            return sum_y / n / (2 * x) if x != 0 else 0.0
+
+        return (n * sum_xy - sum_x * sum_y) / variance
+
+    def _evict(self) -> None:
+        oldest = self.entries.pop(0)
+
+        for metric, x in self._values(oldest).items():
+            sums = self.sums[metric]
+            # Every remaining entry moves one position down
+            sums[2] -= sums[0] - x
+            sums[0] -= x
+            sums[1] -= x * x
+
+    @staticmethod
+    def _values(entry: dict) -> dict[str, float]:
+        return {
+            "topic": float(entry["topic"]),
+            "score": float(entry["score"]),
+            "over_time": -1.0 if entry["over_time"] else 1.0,
+        }
+
+    def _to_mongo_obj(self) -> dict:
+        return {
+            "_id": self.user_id,
+            "window": self.window,
+            "entries": self.entries,
+            "sums": self.sums,
+        }
+
+    @staticmethod
+    def _from_mongo_obj(obj: dict) -> "Progress":
+        return Progress(
+            obj["_id"], window=obj["window"], entries=obj["entries"], sums=obj["sums"]
+        )
+
+    def __eq__(self, __o: object) -> bool:
+        return (
+            isinstance(__o, Progress)
+            and self.user_id == __o.user_id
+            and self.entries == __o.entries
+        )
+
+    def __str__(self) -> str:
+        return f"[progress:{self.user_id}] {self.entries}"
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+
 class MetaData(Storable):
     """
     Storable that accompanies tokens containing any relevent data resulting
     from processing or otherwise
     """
 
-    def __init__(self, topic: int, fluency_score: int, _id: int | None = None) -> None:
-        self.topic: int = topic
+    def __init__(
+        self,
+        topic: int | None,
+        fluency_score: int,
+        _id: int | None = None,
+        outputs: dict | None = None,
+    ) -> None:
+        self.topic: int | None = topic
         self.fluency_score: int = fluency_score
+        # Output of every pipe of the pipeline by name (not stored)
+        self.outputs: dict = outputs if outputs is not None else {}
         self._id: int = hash(self) if _id is None else _id
 
     def _to_mongo_obj(self) -> dict:
@@ -197,9 +396,10 @@ class Utterance(Storable):
         self.metadata: MetaData | None = metadata
         self._id = hash(self) if _id is None else _id
 
-    def _to_mongo_obj(self) -> dict:
+    def _to_mongo_obj(self, vocabulary: Vocabulary | None = None) -> dict:
+        """Tokens are encoded against the given vocabulary, or stored with their own"""
         return {
-            "tokens": pickle.dumps(self.tokens),
+            "tokens": encode_tokens(self.tokens, vocabulary),
             "timestamp": self.timestamp,
             "speech_state": self.speech_state,
             "metadata": self.metadata
@@ -208,7 +408,7 @@ class Utterance(Storable):
         }
 
     @staticmethod
-    def _from_mongo_obj(obj: dict) -> "Utterance":
+    def _from_mongo_obj(obj: dict, vocabulary: Vocabulary | None = None) -> "Utterance":
         metadata = None
 
         try:
@@ -217,7 +417,7 @@ class Utterance(Storable):
             pass
 
         return Utterance(
-            tokens=pickle.loads(obj["tokens"]),
+            tokens=decode_tokens(obj["tokens"], vocabulary),
             timestamp=obj["timestamp"],
             speech_state=obj["speech_state"],
             metadata=metadata
@@ -243,8 +443,32 @@ class Database:
 
     CONNECTION_STRING = "mongodb://localhost/myFirstDatabase"
     questionbank = "assets/question_bank.csv"
+    progress_window = 5
+    utterance_batch_size = 32
+    utterance_max_latency = 0.5  # seconds
+    face_tolerance = FaceIndex.DEFAULT_TOLERANCE
+
+    # Code of the write error for a document whose _id is already stored
+    DUPLICATE_KEY = 11000
+
+    # Users that have a face, the only ones in the face index
+    FACE_QUERY = {"face_encodings.data": {"$ne": b""}}
+
+    def __init__(
+        self,
+        db_name: str | None = None,
+        clear: bool = False,
+        face_index: FaceIndex | None = None,
+    ):
+        """
+        face_index is the backend used to identify users by their face, it defaults to
+        an exact FaceIndex (an IVFFaceIndex can be used for large numbers of users)
+        """
+        self.face_index: FaceIndex = (
+            face_index if face_index is not None else FaceIndex()
+        )
+        self.question_bank = QuestionBank(self.questionbank)
 
-    def __init__(self, db_name: str | None = None, clear: bool = False):
         if db_name is None:
             self._connect_database(clear=clear)
         else:
@@ -255,85 +479,214 @@ class Database:
         Returns a random cue card along with its _id
         TODO intelligently pick cue cards
         """
-        reader = pd.read_csv(self.questionbank)
-        sample = reader.sample()
-        row_number = sample.index[0]
-        return (sample["topic"][row_number], int(row_number))
+        return self.question_bank.random()
 
     def get_cue_card_by_id(self, _id: int) -> str:
         """Returns a cue card based on the given _id"""
-
-        reader = pd.read_csv(self.questionbank)
-        return reader["topic"][_id]
+        return self.question_bank.cue_card(_id)
 
     def get_follow_up_by_id(self, _id: int) -> list[str]:
         """
         Returns follow-up questions corresponding to the cue card whose index is given
         TODO intelligently pick follow-up question
         """
-        reader = pd.read_csv(self.questionbank)
-        return reader["questions"][_id].split("|")
+        return self.question_bank.follow_ups(_id)
+
+    def user_from_encodings(
+        self, face_encodings: NDArray, tolerance: float | None = None
+    ) -> User | None:
+        """Returns the known user closest to the given encodings (within tolerance)"""
+        match = self.nearest_user(face_encodings, tolerance)
+        return match[0] if match is not None else None
+
+    @timed("db.nearest_user")
+    def nearest_user(
+        self, face_encodings: NDArray, tolerance: float | None = None
+    ) -> tuple[User, float] | None:
+        """
+        Returns the known user closest to the given encodings along with its distance,
+        or None if there is no user within the tolerance
+        """
+        match = self.face_index.nearest(
+            face_encodings, self.face_tolerance if tolerance is None else tolerance
+        )
 
-    def user_from_encodings(self, face_encodings: NDArray) -> User | None:
-        for other in self._get_all_users():
-            compared_enc = face_recognition.compare_faces(
-                [face_encodings], other.face_encodings
-            )
-            # print(compared_enc)
-            if compared_enc[0]:
-                return other
+        if match is None:
+            return None
+
+        _id, distance = match
+        obj = self.users.find_one({"_id": _id})
+
+        if obj is None:
+            # The index went stale (user removed outside of this wrapper)
+            self.face_index.remove(_id)
+            return self.nearest_user(face_encodings, tolerance)
 
-        return None
+        return User._from_mongo_obj(obj), distance
 
-    def flush_short_term(self, session: Session):
+    @timed("db.flush_short_term")
+    def flush_short_term(self, session: Session, topic: int | None = None):
         """
         Takes the current short-term memory and stores (the required parts) into long-term memory
+        If the topic of the session's cue card is given, the user's progress is updated as well
         TODO Actually develop a type of short-term memory
         """
         assert session.cue_card_id is not None
 
-        utterances: list[Utterance] = self._get_all_utterances()
+        self.flush_utterances()
+        aggregates = self._aggregate_utterances()
         self.utterances.drop()
-        scores = []
+        self.vocabulary_words.drop()
+        self.vocabulary = Vocabulary()
 
-        for utterance in utterances:
-            if utterance.metadata is not None:
-                scores.append(utterance.metadata.fluency_score)
-
-        session.average_score = sum(scores) / len(scores) if len(scores) != 0.0 else 0.0
+        session.average_score = aggregates["average_score"]
+        session.utterance_count = aggregates["utterance_count"]
+        session.topic_counts = aggregates["topic_counts"]
 
         self._insert_user(session.user)
         self._insert_session(session)
 
+        if topic is not None:
+            self._update_progress(session, topic)
+
+    @timed("db.insert_utterance")
     def insert_utterance(self, utterance: Utterance):
-        """Inserts given utterance into the database"""
-        self.utterances.insert_one(utterance._to_mongo_obj())
+        """Queues the given utterance to be inserted into the database (in a batch)"""
+        self._utterance_queue.put(utterance._to_mongo_obj(self.vocabulary))
+
+    @timed("db.write_utterances")
+    def _write_utterances(self, objs: list[dict]) -> None:
+        """Writes a batch of utterances, after the vocabulary words they use"""
+        pending = self.vocabulary.take_pending()
+
+        if len(pending) != 0:
+            try:
+                self.vocabulary_words.insert_many(
+                    [{"_id": _id, "word": word} for _id, word in pending],
+                    ordered=False,
+                )
+            except BulkWriteError as e:
+                failed = Database._failed_writes(e)
+                self.vocabulary.return_pending([pending[i] for i in failed])
+
+                if len(failed) != 0:
+                    raise
+            except Exception:
+                self.vocabulary.return_pending(pending)
+                raise
+
+        try:
+            self.utterances.insert_many(objs, ordered=False)
+        except BulkWriteError as e:
+            failed = Database._failed_writes(e)
 
+            if len(failed) != 0:
+                raise PartialWriteException(
+                    [f"{len(failed)} of {len(objs)} utterances were not written"],
+                    [objs[i] for i in failed],
+                ) from e
+
+    @staticmethod
+    def _failed_writes(error: BulkWriteError) -> list[int]:
+        """
+        Indices of the documents an unordered insert_many could not write. Duplicate
+        keys are not failures: those documents were written by an earlier attempt.
+        """
+        return sorted(
+            write_error["index"]
+            for write_error in error.details.get("writeErrors", [])
+            if write_error["code"] != Database.DUPLICATE_KEY
+        )
+
+    def close(self) -> None:
+        """Writes the queued utterances and stops the utterance writer thread"""
+        self._utterance_queue.close()
+
+    @timed("db.flush_utterances")
+    def flush_utterances(self) -> None:
+        """Synchronously writes all queued utterances"""
+        self._utterance_queue.flush()
+
+    def utterance_queue_metrics(self) -> dict[str, int]:
+        """Returns the depth and throughput counters of the utterance write queue"""
+        return self._utterance_queue.metrics()
+
+    @timed("db.get_last_utterance")
     def get_last_utterance(self) -> Utterance | None:
-        """Inserts"""
-        objs = self.utterances.aggregate(
-            [
-                {"$group": {"_id": "$timestamp", "docs": {"$push": "$$ROOT"}}},
-                {"$sort": {"_id": 1}},
-                {"$limit": 1},
-            ]
+        """Returns the most recently inserted utterance"""
+        self.flush_utterances()
+        obj = self.utterances.find_one(sort=[("timestamp", DESCENDING)])
+
+        return (
+            Utterance._from_mongo_obj(obj, self.vocabulary) if obj is not None else obj
         )
 
-        # Mongo returns a Cursor object which needs to be iterated over
-        for obj in objs:
-            return Utterance._from_mongo_obj(obj["docs"][0])
+    @timed("db.aggregate_utterances")
+    def _aggregate_utterances(self) -> dict:
+        """
+        Computes the session aggregates of the stored utterances on the server,
+        without loading (and decoding) the utterances themselves
+        """
+        result = next(
+            self.utterances.aggregate(
+                [
+                    {
+                        "$facet": {
+                            "totals": [
+                                {
+                                    "$group": {
+                                        "_id": None,
+                                        "count": {"$sum": 1},
+                                        "average": {"$avg": "$metadata.fluency_score"},
+                                    }
+                                }
+                            ],
+                            "topics": [
+                                {"$match": {"metadata.topic": {"$ne": None}}},
+                                {
+                                    "$group": {
+                                        "_id": "$metadata.topic",
+                                        "count": {"$sum": 1},
+                                    }
+                                },
+                            ],
+                        }
+                    }
+                ]
+            )
+        )
+        totals = result["totals"][0] if len(result["totals"]) != 0 else {}
+
+        return {
+            "utterance_count": totals.get("count", 0),
+            "average_score": totals.get("average") or 0.0,
+            "topic_counts": {
+                str(topic["_id"]): topic["count"]
+                for topic in result["topics"]
+                if topic["_id"] is not None
+            },
+        }
 
     def _get_all_utterances(self) -> list[Utterance]:
+        self.flush_utterances()
         objs = self.utterances.find()
-        return [Utterance._from_mongo_obj(obj) for obj in objs]
+        return [Utterance._from_mongo_obj(obj, self.vocabulary) for obj in objs]
 
     # USERS
+    @timed("db.insert_user")
     def _insert_user(self, user: User) -> None:
         obj = self.users.find_one({"_id": user._id})
 
         if obj is None:
             self.users.insert_one(user._to_mongo_obj())
 
+            if not self.face_index.add(user._id, user.face_encodings):
+                logger.warning(
+                    f"User {user._id} can not be identified by face, "
+                    f"its encoding has shape {user.face_encodings.shape}"
+                )
+
+    @timed("db.get_user_by_name")
     def _get_user_by_name(self, user_name: str) -> User | None:
         obj = self.users.find_one({"name": user_name})
 
@@ -343,17 +696,87 @@ class Database:
         objs: Cursor = self.users.find()
         return [User._from_mongo_obj(obj) for obj in objs]
 
+    def _build_face_index(self) -> None:
+        """
+        Restores the persisted face index, or (re)builds it from the encodings
+        stored in the users collection if it is missing or out of date
+        """
+        if self.face_index.restore() and len(
+            self.face_index
+        ) == self.users.count_documents(self.FACE_QUERY):
+            return
+
+        self.face_index.clear()
+        objs: Cursor = self.users.find(self.FACE_QUERY, {"face_encodings": 1})
+        ids, encodings = [], []
+
+        for obj in objs:
+            ids.append(obj["_id"])
+            encodings.append(decode_face_encodings(obj["face_encodings"]))
+
+        self.face_index.add_many(ids, encodings)
+
     # SESSIONS
+    @timed("db.insert_session")
     def _insert_session(self, session: Session) -> None:
         self.sessions.insert_one(session._to_mongo_obj())
 
+    @timed("db.get_sessions_by_user")
     def get_sessions_by_user(self, user: User) -> list[Session]:
-        objs: Cursor = self.sessions.find({"user._id": user._id})
-        return [Session._from_mongo_obj(obj) for obj in objs]
+        """Returns the sessions of the given user, ordered by start time"""
+        objs: Cursor = self.sessions.find(
+            {"user._id": user._id}, projection={"user": 0}
+        ).sort("start_time", ASCENDING)
+        return [Session._from_mongo_obj(obj, user) for obj in objs]
 
     def _get_all_sessions(self) -> list[Session]:
-        objs: Cursor = self.sessions.find()
-        return [Session._from_mongo_obj(obj) for obj in objs]
+        objs: list[dict] = list(self.sessions.find())
+        user_ids = list({obj["user"]["_id"] for obj in objs})
+        users = {
+            obj["_id"]: User._from_mongo_obj(obj)
+            for obj in self.users.find({"_id": {"$in": user_ids}})
+        }
+        sessions = []
+
+        for obj in objs:
+            user = users.get(obj["user"]["_id"])
+
+            # Sessions of users that no longer exist are skipped, unless they
+            # embed their user (the old format)
+            if user is None and "name" not in obj["user"]:
+                logger.warning(
+                    f"Skipping session {obj['_id']} of unknown user {obj['user']['_id']}"
+                )
+                continue
+
+            sessions.append(Session._from_mongo_obj(obj, user))
+
+        return sessions
+
+    # PROGRESS
+    @timed("db.get_progress_by_user")
+    def get_progress_by_user(self, user: User) -> Progress | None:
+        obj = self.progress.find_one({"_id": user._id})
+
+        return Progress._from_mongo_obj(obj) if obj is not None else obj
+
+    def new_progress(self, user: User) -> Progress:
+        return Progress(user._id, window=self.progress_window)
+
+    @timed("db.save_progress")
+    def _save_progress(self, progress: Progress) -> None:
+        self.progress.replace_one(
+            {"_id": progress.user_id}, progress._to_mongo_obj(), upsert=True
+        )
+
+    def _update_progress(self, session: Session, topic: int) -> None:
+        progress = self.get_progress_by_user(session.user)
+
+        if progress is None:
+            progress = self.new_progress(session.user)
+
+        progress.push(session._id, topic, session.score, session.over_time)
+        self._save_progress(progress)
 
     # DATABASE
     def _connect_database(
@@ -374,13 +797,42 @@ class Database:
         # long-term
         self.users = self._db["users"]
         self.sessions = self._db["sessions"]
+        self.progress = self._db["progress"]
         self.users.create_index("name")
-        self.sessions.create_index("user")
+        self.sessions.create_index([("user._id", ASCENDING), ("start_time", ASCENDING)])
+
+        # Sessions used to embed the whole user, which this index was built on
+        if "user_1" in self.sessions.index_information():
+            self.sessions.drop_index("user_1")
+        self._build_face_index()
 
         # short-term
         self.utterances = self._db["utterances"]
         self.utterances.create_index("timestamp")
 
+        # Words of the utterances' tokens, interned for the current session
+        self.vocabulary_words = self._db["vocabulary"]
+        self.vocabulary = self._load_vocabulary()
+
+        self._utterance_queue = WriteBehindQueue(
+            self._write_utterances,
+            batch_size=self.utterance_batch_size,
+            max_latency=self.utterance_max_latency,
+            name="utterance-writer",
+        )
+
+    def _load_vocabulary(self) -> Vocabulary:
+        pairs = [(obj["_id"], obj["word"]) for obj in self.vocabulary_words.find()]
+        vocabulary = Vocabulary.from_pairs(pairs)
+
+        if len(vocabulary) != len(pairs):
+            logger.warning(
+                f"{len(vocabulary) - len(pairs)} vocabulary words were not stored, "
+                f"the tokens using them are decoded as {MISSING_WORD}"
+            )
+
+        return vocabulary
+
     def _drop_db(self, db_name: str) -> None:
         """Deletes the database by the given name (used for testing purposes)"""
         assert self._client is not None
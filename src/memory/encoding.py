@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import threading
+from typing import Iterable
+
+import numpy
+from numpy._typing import NDArray
+
+# Version of the binary formats below, stored with every encoded value
+FORMAT_VERSION = 1
+
+# Penn Treebank tag set (as produced by nltk.pos_tag). The position of a tag is its
+# code in stored utterances, so tags may only ever be appended to this table.
+PENN_TAGS: tuple[str, ...] = (
+    "CC", "CD", "DT", "EX", "FW", "IN", "JJ", "JJR", "JJS", "LS", "MD", "NN",
+    "NNS", "NNP", "NNPS", "PDT", "POS", "PRP", "PRP$", "RB", "RBR", "RBS", "RP",
+    "SYM", "TO", "UH", "VB", "VBD", "VBG", "VBN", "VBP", "VBZ", "WDT", "WP", "WP$",
+    "WRB", "#", "$", "''", "``", "(", ")", ",", ".", ":", "-LRB-", "-RRB-",
+    "-NONE-", "--",
+)  # fmt: skip
+# Tags outside the table are stored with the last code, and decoded as UNKNOWN_TAG
+UNKNOWN_TAG = "-UNKNOWN-"
+_UNKNOWN_CODE = 255
+_TAG_CODES: dict[str, int] = {tag: code for code, tag in enumerate(PENN_TAGS)}
+_TAGS = numpy.array(
+    PENN_TAGS + (UNKNOWN_TAG,) * (_UNKNOWN_CODE + 1 - len(PENN_TAGS)), dtype=object
+)
+
+# Word of a vocabulary id whose word was lost (see Vocabulary.from_pairs)
+MISSING_WORD = "-MISSING-"
+
+_TAG_DTYPE = numpy.dtype(numpy.uint8)
+_ID_DTYPE = numpy.dtype("<u4")
+_FLOAT_DTYPE = numpy.dtype("<f4")
+
+
+class LegacyFormatException(Exception):
+    """Exception that indicates a value is still stored in the old (pickled) format"""
+
+    def __init__(self, args):
+        super().__init__(*args)
+
+
+class Vocabulary:
+    """
+    Interned token strings, tokens are stored as ids into this vocabulary.
+    Words interned since the last call to take_pending (or given back by
+    return_pending) are kept so they can be persisted alongside the utterances
+    that use them.
+    """
+
+    def __init__(self, words: list[str] | None = None) -> None:
+        self.words: list[str] = list(words) if words is not None else []
+        self._ids: dict[str, int] = {
+            word: _id for _id, word in enumerate(self.words) if word != MISSING_WORD
+        }
+        self._persisted = len(self.words)
+        self._returned: list[tuple[int, str]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[tuple[int, str]]) -> Vocabulary:
+        """
+        Vocabulary of persisted (id, word) pairs. Ids without a pair (words whose
+        write failed) are kept as MISSING_WORD, so no other id changes.
+        """
+        by_id = dict(pairs)
+        return cls(
+            [by_id.get(_id, MISSING_WORD) for _id in range(max(by_id, default=-1) + 1)]
+        )
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def intern(self, word: str) -> int:
+        _id = self._ids.get(word)
+
+        if _id is not None:
+            return _id
+
+        with self._lock:
+            _id = self._ids.get(word)
+
+            if _id is None:
+                _id = len(self.words)
+                self.words.append(word)
+                self._ids[word] = _id
+
+        return _id
+
+    def take_pending(self) -> list[tuple[int, str]]:
+        """Returns the (id, word) pairs that are not persisted yet, in order of id"""
+        with self._lock:
+            pending = self._returned + [
+                (_id, self.words[_id])
+                for _id in range(self._persisted, len(self.words))
+            ]
+            self._returned = []
+            self._persisted = len(self.words)
+
+        return pending
+
+    def return_pending(self, pending: list[tuple[int, str]]) -> None:
+        """Marks words returned by take_pending as not persisted (after a failed write)"""
+        with self._lock:
+            self._returned = sorted(pending + self._returned)
+
+
+def encode_tokens(
+    tokens: list[tuple[str, str]], vocabulary: Vocabulary | None = None
+) -> dict:
+    """
+    Encodes POS-tagged tokens as uint8 tag codes and uint32 ids into the vocabulary.
+    Without a vocabulary the words are interned per utterance and stored inline.
+    Tags outside PENN_TAGS are stored as UNKNOWN_TAG.
+    """
+    inline = vocabulary is None
+    vocabulary = Vocabulary() if vocabulary is None else vocabulary
+
+    tags = numpy.fromiter(
+        (_TAG_CODES.get(tag, _UNKNOWN_CODE) for _, tag in tokens),
+        dtype=_TAG_DTYPE,
+        count=len(tokens),
+    )
+
+    ids = numpy.fromiter(
+        (vocabulary.intern(word) for word, _ in tokens),
+        dtype=_ID_DTYPE,
+        count=len(tokens),
+    )
+    obj = {"v": FORMAT_VERSION, "tags": tags.tobytes(), "ids": ids.tobytes()}
+
+    if inline:
+        obj["words"] = vocabulary.words
+
+    return obj
+
+
+def decode_tokens(
+    obj: dict | bytes, vocabulary: Vocabulary | None = None
+) -> list[tuple[str, str]]:
+    """Decodes tokens encoded by encode_tokens"""
+    _check_format(obj)
+    assert isinstance(obj, dict)
+
+    if "words" in obj:
+        words = obj["words"]
+    elif vocabulary is not None:
+        words = vocabulary.words
+    else:
+        raise ValueError("Tokens were encoded against a vocabulary, but none is given")
+
+    ids = numpy.frombuffer(obj["ids"], dtype=_ID_DTYPE)
+    tags = _TAGS[numpy.frombuffer(obj["tags"], dtype=_TAG_DTYPE)]
+
+    return [(words[_id], tag) for _id, tag in zip(ids.tolist(), tags.tolist())]
+
+
+def encode_float32(array: NDArray) -> dict:
+    """Encodes an array as raw little-endian float32 bytes"""
+    array = numpy.ascontiguousarray(array, dtype=_FLOAT_DTYPE)
+    return {"v": FORMAT_VERSION, "shape": list(array.shape), "data": array.tobytes()}
+
+
+def decode_float32(obj: dict | bytes) -> NDArray:
+    """Decodes an array encoded by encode_float32 without copying it (read-only)"""
+    _check_format(obj)
+    assert isinstance(obj, dict)
+
+    return numpy.frombuffer(obj["data"], dtype=_FLOAT_DTYPE).reshape(obj["shape"])
+
+
+def encode_face_encodings(encodings: NDArray) -> dict:
+    """Encodes face encodings as raw little-endian float32 bytes"""
+    return encode_float32(encodings)
+
+
+def decode_face_encodings(obj: dict | bytes) -> NDArray:
+    """Decodes face encodings without copying them (the result is read-only)"""
+    return decode_float32(obj)
+
+
+def _check_format(obj: dict | bytes) -> None:
+    if isinstance(obj, (bytes, bytearray)):
+        raise LegacyFormatException(
+            ["Value is stored as a pickle, run tools/migrate_encoding.py first"]
+        )
+
+    if obj.get("v") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported format version {obj.get('v')}")
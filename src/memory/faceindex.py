@@ -0,0 +1,470 @@
+from __future__ import annotations
+
+import os
+
+import numpy
+from numpy._typing import NDArray
+
+
+class FaceIndex:
+    """
+    In-memory index over the face encodings of all known users.
+    Encodings are kept in a contiguous float32 matrix alongside an array of
+    user ids, so a lookup is a single batched distance computation.
+    """
+
+    DEFAULT_TOLERANCE = 0.6  # same default as face_recognition.compare_faces
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, dimensions: int | None = None) -> None:
+        # Dimensions are inferred from the first (non-empty) encoding if not given
+        self.dimensions: int | None = dimensions
+        self.clear()
+
+    def clear(self) -> None:
+        self._size = 0
+        self._ids: NDArray = numpy.empty(0, dtype=numpy.int64)
+        self._encodings: NDArray = numpy.empty((0, 0), dtype=numpy.float32)
+        self._norms: NDArray = numpy.empty(0, dtype=numpy.float32)
+        self._positions: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, _id: int) -> bool:
+        return _id in self._positions
+
+    @property
+    def ids(self) -> NDArray:
+        return self._ids[: self._size]
+
+    @property
+    def encodings(self) -> NDArray:
+        return self._encodings[: self._size]
+
+    def add(self, _id: int, encoding: NDArray) -> bool:
+        """
+        Adds (or replaces) the encoding of the given user id.
+        Returns False if the encoding is empty or does not match the index' dimensions.
+        """
+        vector = self._as_vector(encoding, infer=True)
+
+        if vector is None:
+            return False
+
+        position = self._positions.get(_id)
+
+        if position is None:
+            self._reserve(self._size + 1)
+            position = self._size
+            self._size += 1
+            self._positions[_id] = position
+            self._ids[position] = _id
+
+        self._encodings[position] = vector
+        self._norms[position] = vector @ vector
+        return True
+
+    def add_many(self, ids: list[int], encodings: list[NDArray]) -> None:
+        for _id, encoding in zip(ids, encodings):
+            self.add(_id, encoding)
+
+    def remove(self, _id: int) -> None:
+        """Removes the given user id by moving the last entry into its slot"""
+        position = self._positions.pop(_id, None)
+
+        if position is None:
+            return
+
+        last = self._size - 1
+
+        if position != last:
+            moved_id = int(self._ids[last])
+            self._ids[position] = moved_id
+            self._encodings[position] = self._encodings[last]
+            self._norms[position] = self._norms[last]
+            self._positions[moved_id] = position
+
+        self._size -= 1
+
+    def restore(self) -> bool:
+        """Loads previously persisted state, returns False if there is none"""
+        return False
+
+    def distances(self, encoding: NDArray) -> NDArray | None:
+        """Returns the euclidean distance between the encoding and every indexed encoding"""
+        if self._size == 0:
+            return None
+
+        vector = self._as_vector(encoding)
+
+        if vector is None:
+            return None
+
+        # |a - b|^2 = |a|^2 + |b|^2 - 2ab, with |b|^2 precomputed for every row
+        squared = self.encodings @ (-2.0 * vector)
+        squared += self._norms[: self._size]
+        squared += vector @ vector
+        numpy.maximum(squared, 0.0, out=squared)
+        return numpy.sqrt(squared)
+
+    def nearest(
+        self, encoding: NDArray, tolerance: float = DEFAULT_TOLERANCE
+    ) -> tuple[int, float] | None:
+        """
+        Returns the id of the nearest user and its distance,
+        or None if no user lies within the given tolerance
+        """
+        distances = self.distances(encoding)
+
+        if distances is None:
+            return None
+
+        position = int(numpy.argmin(distances))
+        distance = float(distances[position])
+
+        if distance > tolerance:
+            return None
+
+        return int(self._ids[position]), distance
+
+    def _as_vector(self, encoding: NDArray, infer: bool = False) -> NDArray | None:
+        vector = numpy.asarray(encoding, dtype=numpy.float32).reshape(-1)
+
+        # Users without a face (e.g. an empty encoding) can not be indexed
+        if vector.shape[0] == 0:
+            return None
+
+        if self.dimensions is None and infer:
+            self.dimensions = vector.shape[0]
+
+        if vector.shape[0] != self.dimensions:
+            return None
+
+        return vector
+
+    def _reserve(self, capacity: int) -> None:
+        """Grows the underlying arrays geometrically so appends are amortised O(1)"""
+        current = self._ids.shape[0]
+
+        if capacity <= current and self._encodings.shape[1] == self.dimensions:
+            return
+
+        new_capacity = max(self.INITIAL_CAPACITY, current)
+
+        while new_capacity < capacity:
+            new_capacity *= 2
+
+        assert self.dimensions is not None
+
+        ids = numpy.empty(new_capacity, dtype=numpy.int64)
+        encodings = numpy.empty((new_capacity, self.dimensions), dtype=numpy.float32)
+        norms = numpy.empty(new_capacity, dtype=numpy.float32)
+
+        if self._size != 0:
+            ids[: self._size] = self._ids[: self._size]
+            encodings[: self._size] = self._encodings[: self._size]
+            norms[: self._size] = self._norms[: self._size]
+
+        self._ids, self._encodings, self._norms = ids, encodings, norms
+
+
+class IVFFaceIndex(FaceIndex):
+    """
+    Approximate face index using an inverted file (IVF) over k-means centroids.
+    A lookup only scans the encodings of the n_probe lists closest to the query
+    and re-ranks those candidates with exact distances, so a match is found with
+    the same distance (and tolerance) compare_faces would use.
+
+    Knobs:
+    * n_lists: number of k-means clusters, more lists means smaller scans
+    * n_probe: lists scanned per lookup, trades latency for recall
+    * train_size: number of encodings after which the centroids are trained,
+      below this the index searches exhaustively
+
+    If a path is given, the index is persisted to that directory as it grows,
+    so it can be restored at startup instead of being rebuilt.
+    """
+
+    ITERATIONS = 10
+    SAMPLES_PER_LIST = 256
+    CHUNK_SIZE = 65536
+
+    def __init__(
+        self,
+        path: str | None = None,
+        n_lists: int = 256,
+        n_probe: int = 8,
+        train_size: int | None = None,
+        dimensions: int | None = None,
+        seed: int = 0,
+    ) -> None:
+        self.path = path
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size if train_size is not None else n_lists * 39
+        self.seed = seed
+        self._bulk = False
+        super().__init__(dimensions)
+
+    def clear(self) -> None:
+        super().clear()
+        self.centroids: NDArray | None = None
+        self._assignments: NDArray = numpy.empty(0, dtype=numpy.int32)
+        self._lists: list[list[int]] = []
+        self._persisted = 0
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def add(self, _id: int, encoding: NDArray) -> bool:
+        replaced = _id in self._positions
+
+        if not super().add(_id, encoding):
+            return False
+
+        position = self._positions[_id]
+
+        if replaced and self.trained:
+            self._unlist(position)
+
+        if not self.trained:
+            self._assignments[position] = -1
+
+            if self._size >= self.train_size and not self._bulk:
+                self.train()  # persists the whole index
+                return True
+        else:
+            list_id = int(self._closest_lists(self._encodings[position], 1)[0])
+            self._assignments[position] = list_id
+            self._lists[list_id].append(position)
+
+        if self.path is not None and not self._bulk:
+            if replaced or position != self._persisted:
+                self.save()
+            else:
+                self._append(position)
+
+        return True
+
+    def add_many(self, ids: list[int], encodings: list[NDArray]) -> None:
+        self._bulk = True
+
+        try:
+            super().add_many(ids, encodings)
+        finally:
+            self._bulk = False
+
+        if not self.trained and self._size >= self.train_size:
+            self.train()
+        elif self.path is not None:
+            self.save()
+
+    def remove(self, _id: int) -> None:
+        position = self._positions.get(_id)
+
+        if position is None:
+            return
+
+        last = self._size - 1
+
+        if self.trained:
+            self._unlist(position)
+
+            if position != last:
+                moved_list = self._lists[self._assignments[last]]
+                moved_list[moved_list.index(last)] = position
+
+        self._assignments[position] = self._assignments[last]
+        super().remove(_id)
+
+        if self.path is not None:
+            self.save()
+
+    def nearest(
+        self, encoding: NDArray, tolerance: float = FaceIndex.DEFAULT_TOLERANCE
+    ) -> tuple[int, float] | None:
+        if not self.trained:
+            return super().nearest(encoding, tolerance)
+
+        if self._size == 0:
+            return None
+
+        vector = self._as_vector(encoding)
+
+        if vector is None:
+            return None
+
+        probed = self._closest_lists(vector, self.n_probe)
+        candidates = numpy.concatenate(
+            [
+                numpy.asarray(self._lists[list_id], dtype=numpy.int64)
+                for list_id in probed
+            ]
+        )
+
+        if candidates.size == 0:
+            return None
+
+        # Exact re-rank of the candidates
+        squared = self._encodings[candidates] @ (-2.0 * vector)
+        squared += self._norms[candidates]
+        squared += vector @ vector
+        best = int(numpy.argmin(squared))
+        distance = float(numpy.sqrt(max(squared[best], 0.0)))
+
+        if distance > tolerance:
+            return None
+
+        return int(self._ids[candidates[best]]), distance
+
+    def train(self) -> None:
+        """Trains the centroids with k-means on (a sample of) the indexed encodings"""
+        if self._size == 0:
+            return
+
+        rng = numpy.random.default_rng(self.seed)
+        data = self.encodings
+        n_lists = min(self.n_lists, self._size)
+        sample_size = min(self._size, n_lists * self.SAMPLES_PER_LIST)
+        sample = data[numpy.sort(rng.choice(self._size, sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.ITERATIONS):
+            labels = self._nearest_centroids(sample, centroids)
+            order = numpy.argsort(labels, kind="stable")
+            counts = numpy.bincount(labels, minlength=n_lists)
+            filled = counts > 0
+            starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))[filled]
+            sums = numpy.add.reduceat(sample[order], starts, axis=0)
+            centroids[filled] = sums / counts[filled, None]
+
+        self.centroids = centroids
+        self._assignments[: self._size] = self._nearest_centroids(data, centroids)
+        self._rebuild_lists()
+
+        if self.path is not None:
+            self.save()
+
+    # PERSISTENCE
+    def save(self) -> None:
+        """Writes the full index to its directory"""
+        assert self.path is not None
+        os.makedirs(self.path, exist_ok=True)
+
+        self._write_meta()
+        self.ids.tofile(self._file("ids.i64"))
+        self.encodings.tofile(self._file("encodings.f32"))
+        self._assignments[: self._size].tofile(self._file("lists.i32"))
+        self._persisted = self._size
+
+    def restore(self) -> bool:
+        if self.path is None or not os.path.exists(self._file("meta.npz")):
+            return False
+
+        meta = numpy.load(self._file("meta.npz"))
+        dimensions = int(meta["dimensions"])
+        ids = numpy.fromfile(self._file("ids.i64"), dtype=numpy.int64)
+        encodings = numpy.fromfile(self._file("encodings.f32"), dtype=numpy.float32)
+        assignments = numpy.fromfile(self._file("lists.i32"), dtype=numpy.int32)
+
+        # An interrupted append can leave the files with different lengths
+        size = min(ids.shape[0], assignments.shape[0])
+
+        if dimensions != 0:
+            size = min(size, encodings.shape[0] // dimensions)
+
+        self.clear()
+        self.dimensions = dimensions if dimensions != 0 else None
+        self.centroids = meta["centroids"] if meta["centroids"].size != 0 else None
+
+        if size != 0:
+            self._reserve(size)
+            self._ids[:size] = ids[:size]
+            self._encodings[:size] = encodings[: size * dimensions].reshape(
+                size, dimensions
+            )
+            self._norms[:size] = numpy.einsum(
+                "ij,ij->i", self._encodings[:size], self._encodings[:size]
+            )
+            self._assignments[:size] = assignments[:size]
+            self._size = size
+            self._positions = {int(_id): i for i, _id in enumerate(self.ids)}
+
+        if self.trained:
+            self._rebuild_lists()
+
+        self._persisted = size
+        return True
+
+    def _append(self, position: int) -> None:
+        """Appends a single entry to the persisted index"""
+        assert self.path is not None
+        mode = "ab" if self._persisted != 0 else "wb"
+
+        if self._persisted == 0:
+            os.makedirs(self.path, exist_ok=True)
+            self._write_meta()
+
+        with open(self._file("ids.i64"), mode) as f:
+            f.write(self._ids[position : position + 1].tobytes())
+        with open(self._file("encodings.f32"), mode) as f:
+            f.write(self._encodings[position].tobytes())
+        with open(self._file("lists.i32"), mode) as f:
+            f.write(self._assignments[position : position + 1].tobytes())
+
+        self._persisted += 1
+
+    def _write_meta(self) -> None:
+        numpy.savez(
+            self._file("meta.npz"),
+            dimensions=numpy.int64(self.dimensions or 0),
+            centroids=self.centroids
+            if self.centroids is not None
+            else numpy.empty((0, 0), dtype=numpy.float32),
+        )
+
+    def _file(self, name: str) -> str:
+        assert self.path is not None
+        return os.path.join(self.path, name)
+
+    # INTERNALS
+    def _reserve(self, capacity: int) -> None:
+        super()._reserve(capacity)
+
+        if self._assignments.shape[0] != self._ids.shape[0]:
+            assignments = numpy.full(self._ids.shape[0], -1, dtype=numpy.int32)
+            assignments[: self._assignments.shape[0]] = self._assignments
+            self._assignments = assignments
+
+    def _unlist(self, position: int) -> None:
+        self._lists[self._assignments[position]].remove(position)
+
+    def _rebuild_lists(self) -> None:
+        assert self.centroids is not None
+        assignments = self._assignments[: self._size]
+        order = numpy.argsort(assignments, kind="stable")
+        bounds = numpy.searchsorted(
+            assignments[order], numpy.arange(1, self.centroids.shape[0])
+        )
+        self._lists = [members.tolist() for members in numpy.split(order, bounds)]
+
+    def _closest_lists(self, vector: NDArray, n: int) -> NDArray:
+        assert self.centroids is not None
+        squared = self.centroids @ (-2.0 * vector)
+        squared += numpy.einsum("ij,ij->i", self.centroids, self.centroids)
+        n = min(n, squared.shape[0])
+        return numpy.argpartition(squared, n - 1)[:n]
+
+    def _nearest_centroids(self, data: NDArray, centroids: NDArray) -> NDArray:
+        norms = numpy.einsum("ij,ij->i", centroids, centroids)
+        labels = numpy.empty(data.shape[0], dtype=numpy.int32)
+
+        for start in range(0, data.shape[0], self.CHUNK_SIZE):
+            chunk = data[start : start + self.CHUNK_SIZE]
+            squared = chunk @ (-2.0 * centroids.T)
+            squared += norms
+            labels[start : start + self.CHUNK_SIZE] = numpy.argmin(squared, axis=1)
+
+        return labels
@@ -7,35 +7,48 @@ from typing import Tuple, Dict
 
 
 from numpy._typing import NDArray
-from spacy.tokens.doc import Doc
-
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import sent_tokenize
 
 
+from memory.cuecardtopics import CueCardTopics
+from memory.processing.fluency import FluencyFeatures
 from memory.processing.pipeline import Pipeline, PosPipe
+from memory.processing.stream import StreamingProcessor
+from memory.shortterm import ShortTermMemory
+from memory.topictracker import TopicTracker
 from memory.databasewrapper import (
     Database,
+    Progress,
     Session,
     User,
     Utterance,
 )
-from utils.topic_model import TopicModel
+from utils import latency
+from utils.topic_model import TopicModel, require_nltk
+from utils.topic_model_manager import TopicModelManager
 
 
 class MemoryManager:
     """Main memory interface module"""
 
-    processing = Pipeline()
+    processing: Pipeline
     session: Session | None = None
     user: User | None = None
-    topic_model: TopicModel = TopicModel()
+    topic_model: TopicModel
     face: NDArray | None = None  # user's image provided when session starts
 
     topic_mistakes = 0
     number_of_utterances = 0
 
+    # Window of recent speech that is judged to be on topic or not
+    topic_window_tokens: int | None = 100
+    topic_window_seconds: float | None = None
+    topic_threshold = 0.8
+
+    # Per-stage latency statistics (see utils.latency), off by default. When on,
+    # a summary is logged every latency_log_interval seconds (if not None)
+    latency_stats = False
+    latency_log_interval: float | None = 60.0
+
     def __init__(self, database_name: str | None = None, clear_db: bool = False):
         self.db: Database = (
             Database(clear=clear_db)
@@ -43,8 +56,32 @@ class MemoryManager:
             else Database("database_name", clear=clear_db)
         )
 
-        # Cached processed cue card
-        self._tokenized_cue_card: list[tuple[str, str]] | None = None
+        self.short_term = ShortTermMemory()
+
+        # Shipped topic models, the active one can be swapped with set_topic_model
+        self.topic_models = TopicModelManager()
+        self.topic_model = self.topic_models.active
+
+        # Per instance, as set_topic_model changes the model of its topic pipe
+        self.processing = Pipeline()
+        self.processing.set_topic_model(self.topic_model)
+
+        self.topic_tracker = TopicTracker(
+            self.topic_model, self.topic_window_tokens, self.topic_window_seconds
+        )
+        # Running fluency and topic of the current speech turn
+        self.speech = StreamingProcessor(self.processing, self.topic_tracker)
+        # Fluency features of all speech turns of the session
+        self.speech_features = FluencyFeatures()
+
+        # Precomputed keywords and topics of every cue card
+        self.cue_card_topics = CueCardTopics(self.db.question_bank, self.topic_model)
+
+        if self.latency_stats:
+            latency.recorder.enable()
+
+            if self.latency_log_interval is not None:
+                latency.recorder.start_logging(self.latency_log_interval)
 
     # SESSION
     def start_session(self, face_encoding: NDArray):
@@ -64,6 +101,10 @@ class MemoryManager:
 
         self.number_of_utterances = 0
         self.topic_mistakes = 0
+        self.short_term.clear()
+        self.topic_tracker.clear()
+        self.speech.reset()
+        self.speech_features = FluencyFeatures()
 
         self.face = face_encoding
         user = self.user_identify(self.face)
@@ -89,10 +130,21 @@ class MemoryManager:
 
     def stop_session(self) -> str:
         """Stops the session and flushes short-term memory to long-term"""
+        self.db.flush_utterances()
+
         if self.session is None:
             return
 
         self.session.end_time = time.time()
+        self._end_speech_turn()
+
+        if len(self.speech_features) != 0:
+            self.session.fluency_features = self.speech_features.vector()
+            self.session.fluency_score = float(
+                self.speech.fluency_scorer.get_speech_fluency(
+                    self.session.fluency_features
+                )[0]
+            )
         self.session.on_topic = (
             (
                 (self.number_of_utterances - self.topic_mistakes)
@@ -102,11 +154,59 @@ class MemoryManager:
             else 1.0
         )
 
-        self.db.flush_short_term(self.session)
+        self.db.flush_short_term(self.session, topic=self._cue_card_topic())
         report = self.get_user_session_report()
         # self.session = None
         return report
 
+    def close(self):
+        """Writes everything that is pending and stops the database's background writer"""
+        self.db.close()
+
+    def _cue_card_topic(self) -> int | None:
+        """Returns the dominant topic of the session's cue card"""
+        assert self.session is not None
+
+        if self.session.cue_card_id is None:
+            return None
+
+        if self.session.cue_card_topic is None:
+            self._cache_cue_card_topics()
+
+        return self.session.cue_card_topic
+
+    def _cache_cue_card_topics(self):
+        """Looks up the topics of the session's cue card once"""
+        assert self.session is not None
+        assert self.session.cue_card_id is not None
+
+        _, topic, distribution = self.cue_card_topics.lookup(self.session.cue_card_id)
+        self.session.cue_card_topic = topic
+        self.session.cue_card_distribution = distribution
+
+    def set_topic_model(self, name: str):
+        """
+        Swaps the topic model (one of topic_models.available()) without restarting.
+        The new model is loaded before anything is swapped.
+        """
+        model = self.topic_models.activate(name)
+
+        self.topic_model = model
+        self.processing.set_topic_model(model)
+        self.cue_card_topics = CueCardTopics(self.db.question_bank, model)
+
+        # Word ids and topics of the old model mean nothing to the new one
+        self.topic_tracker = TopicTracker(
+            model, self.topic_window_tokens, self.topic_window_seconds
+        )
+        for utterance in self.short_term:
+            self.topic_tracker.add(utterance.tokens, utterance.timestamp)
+        self.speech.topic_tracker = self.topic_tracker
+
+        if self.session is not None:
+            self.session.cue_card_topic = None
+            self.session.cue_card_distribution = None
+
     # USER
     def user_info(self) -> User:
         """Returns info on the user in the current session"""
@@ -144,6 +244,7 @@ class MemoryManager:
         assert self.session.user is not None
 
     # DIALOG
+    @latency.timed("memory.submit_utterance")
     def submit_utterance(self, text: str, speech_state: bool = False):
         """
         Submit an utterance to short-term memory.
@@ -154,37 +255,44 @@ class MemoryManager:
         """
         assert self.session is not None
 
-        if len(text.strip()) == 0 or not speech_state:
+        if not speech_state:
+            return
+
+        # Silences are counted as pauses by the gap before the next fragment
+        if len(text.strip()) == 0:
             return
 
         self.number_of_utterances += 1
 
         timestamp: float = time.time()
-        tokens, metadata = self.processing.process(text)
+        tokens, metadata = self.speech.feed(text, timestamp)
         utterance = Utterance(tokens, timestamp, speech_state, metadata)
 
+        self.short_term.add(utterance)
         self.db.insert_utterance(utterance)
 
         if not self._is_on_cue_topic():
-            self.session.on_topic += 1
+            self.topic_mistakes += 1
 
+    @latency.timed("memory.topic_check")
     def _is_on_cue_topic(self) -> bool:
-        """Returns if the last speech was 'on topic' with regard to the cue card"""
+        """
+        Returns if the recent speech (the window of the topic tracker) is
+        'on topic' with regard to the cue card
+        """
         assert self.session is not None
 
         if self.session.cue_card_id is None:
             raise MissingCueCardException("A cue card has not been requested yet")
 
-        assert self._tokenized_cue_card is not None
-
-        last_utterance: Utterance | None = self.db.get_last_utterance()
+        if self.session.cue_card_distribution is None:
+            self._cache_cue_card_topics()
 
-        if last_utterance is not None:
-            return self.topic_model.is_on_topic(
-                last_utterance.tokens,
-                self._tokenized_cue_card,
-            )
-        return True
+        assert self.session.cue_card_distribution is not None
+        return (
+            self.topic_tracker.on_topic_probability(self.session.cue_card_distribution)
+            > self.topic_threshold
+        )
 
     def submit_speech_data(self, speech_time: int, over_spoke: bool):
         """
@@ -194,6 +302,23 @@ class MemoryManager:
         assert self.session is not None
 
         self.session.over_time = over_spoke
+        self._end_speech_turn(speech_time)
+
+    def _end_speech_turn(self, speech_time: float | None = None):
+        """Ends the current speech turn, adding its features to those of the session"""
+        if self.speech.ended:
+            return
+
+        self.speech.end(speech_time)
+        self.speech_features.merge(self.speech.features)
+
+    def get_latency_stats(self) -> dict[str, dict[str, float]]:
+        """Latency statistics per stage (empty unless latency_stats is on)"""
+        return latency.recorder.stats()
+
+    def get_speech_fluency(self) -> tuple[int, str]:
+        """Fluency score and category of the current (or last) speech turn"""
+        return self.speech.fluency
 
     def submit_speech_emotions(self, emotions: Dict[str, int]):
         """
@@ -218,7 +343,7 @@ class MemoryManager:
         if self.session.cue_card_id is None:
             card, _id = self.db.get_cue_card_random()
             self.session.cue_card_id = _id
-            self._tokenized_cue_card = self.processing.process(card)[0]
+            self._cache_cue_card_topics()
         else:
             card = self.db.get_cue_card_by_id(self.session.cue_card_id)
 
@@ -257,40 +382,48 @@ class MemoryManager:
         for session in sessions:
             assert session.cue_card_id is not None
 
-            cue_card = self.db.get_cue_card_by_id(session.cue_card_id)
-
-            keywords = self.topic_model.preprocess(cue_card)
-            topic = self.topic_model.get_topic_most_likely(keywords)
+            keywords, topic, _ = self.cue_card_topics.lookup(session.cue_card_id)
 
-            session_progress = (session, topic[0], keywords)
+            session_progress = (session, topic, keywords)
             sessions_progress.append(session_progress)
 
         return sessions_progress
 
-    def get_user_progress_report(self, window: int = 5) -> str:
+    def _get_progress(self, user: User) -> Progress:
+        """
+        Returns the rolling progress of the user. Users that have sessions but no
+        progress yet get it built once from their (most recent) past sessions
+        """
+        progress = self.db.get_progress_by_user(user)
+
+        if progress is not None:
+            return progress
+
+        progress = self.db.new_progress(user)
+        sessions_progress = sorted(
+            self._get_user_progress(user), key=lambda x: x[0].start_time
+        )
+
+        for session, topic, _ in sessions_progress[-progress.window :]:
+            progress.push(session._id, topic, session.score, session.over_time)
+
+        self.db._save_progress(progress)
+        return progress
+
+    def get_user_progress_report(self, window: int | None = None) -> str:
+        """Reports the progress over the last `window` sessions (defaults to the progress window)"""
         assert self.session is not None
         assert self.session.user is not None
 
-        sessions_progress = self._get_user_progress(self.session.user)[0:window]
+        progress = self._get_progress(self.session.user)
+        window = progress.window if window is None else window
 
-        if len(sessions_progress) == 0:
+        if len(progress) == 0 or window == 0:
             return " Sorry. you don't have any progress report yet. Start practicing. "
 
-        topic_factor = np.polyfit(
-            list(map(lambda x: x[1], sessions_progress)),
-            np.linspace(0, len(sessions_progress), len(sessions_progress)),
-            1,
-        )[0]
-        fluency_factor = np.polyfit(
-            list(map(lambda x: x[0].average_score, sessions_progress)),
-            np.linspace(0, len(sessions_progress), len(sessions_progress)),
-            1,
-        )[0]
-        over_time_factor = np.polyfit(
-            list(map(lambda x: -1 if x[0].over_time else 1, sessions_progress)),
-            np.linspace(0, len(sessions_progress), len(sessions_progress)),
-            1,
-        )[0]
+        topic_factor = progress.slope("topic", window)
+        fluency_factor = progress.slope("score", window)
+        over_time_factor = progress.slope("over_time", window)
 
         on_topic = (
             "It seems like you have been improving staying on topic! Keep it up! "
@@ -323,7 +456,7 @@ class MemoryManager:
             if self.session.over_time
             else " "
         )
-        fluency_score = f"In terms of fluency, I've determined that you have a score of {int(self.session.average_score)} out of 9. "
+        fluency_score = f"In terms of fluency, I've determined that you have a score of {int(self.session.score)} out of 9. "
 
         nervousness = "I couldn't detect any evident anxiety from your speech. Well done. "
 
@@ -348,8 +481,9 @@ class MemoryManager:
         elif "i am" in user_speech:
             return user_speech.split("i am")[1].split()[0]
 
-        nltk.download("punkt")
-        nltk.download("averaged_perceptron_tagger")
+        import nltk
+
+        require_nltk("punkt", "averaged_perceptron_tagger")
         tokens = nltk.word_tokenize(user_speech)
 
         # CASE 2: check if the user's name is in the name database
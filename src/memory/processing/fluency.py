@@ -1,41 +1,174 @@
+from __future__ import annotations
+
 from collections import Counter
-from spacy.tokens.doc import Doc
+
+import numpy
+from numpy._typing import NDArray
 
 from utils.topic_model import TopicModel
 
+# Connectives (single words and pairs of words) counted as linking ideas
+CONNECTIVES = frozenset(
+    (
+        "also", "although", "and", "because", "besides", "but", "consequently",
+        "finally", "firstly", "furthermore", "however", "instead", "meanwhile",
+        "moreover", "nevertheless", "or", "otherwise", "secondly", "since", "so",
+        "then", "therefore", "though", "thus", "unless", "whereas", "while",
+        "as well", "even though", "for example", "for instance", "in addition",
+        "in contrast", "in fact", "so that",
+    )
+)  # fmt: skip
+
+
+class FluencyFeatures:
+    """
+    Running counters of a stretch of speech (a speech turn or a whole session).
+    Every token updates them in O(1); vector() turns them into the features that
+    LanguageFluency.get_speech_fluency scores.
+    """
+
+    FEATURES = (
+        "words",
+        "type_token_ratio",
+        "repetition_rate",
+        "max_repetitions",
+        "connective_rate",
+        "words_per_second",
+        "pauses",
+        "speech_time",
+    )
+
+    def __init__(self) -> None:
+        self.words = 0
+        self.word_counts: Counter[str] = Counter()
+        self.keywords = 0
+        self.keyword_counts: Counter[str] = Counter()
+        self.repeated = 0  # keywords that were used before
+        self.max_repetitions = 0
+        self.connectives = 0
+        self.pauses = 0
+        self.speech_time = 0.0
+
+        self._previous = ""  # last word, for connectives of two words
+
+    def __len__(self) -> int:
+        return self.words
+
+    def add(self, tokens: list[tuple[str, str]], keywords: list[str]) -> None:
+        """Adds the (tagged) tokens and keywords of the next fragment"""
+        for word, _ in tokens:
+            word = word.lower()
+            self.words += 1
+            self.word_counts[word] += 1
+
+            if word in CONNECTIVES or f"{self._previous} {word}" in CONNECTIVES:
+                self.connectives += 1
+
+            self._previous = word
+
+        for keyword in keywords:
+            count = self.keyword_counts[keyword] + 1
+            self.keyword_counts[keyword] = count
+            self.keywords += 1
+            self.repeated += count > 1
+            self.max_repetitions = max(self.max_repetitions, count)
+
+    def add_pause(self) -> None:
+        self.pauses += 1
+
+    def add_speech_time(self, seconds: float) -> None:
+        self.speech_time += seconds
+
+    def merge(self, other: FluencyFeatures) -> None:
+        """Adds the counters of other, e.g. of a speech turn to those of its session"""
+        for word, count in other.word_counts.items():
+            self.word_counts[word] += count
+
+        for keyword, count in other.keyword_counts.items():
+            previous = self.keyword_counts[keyword]
+            self.keyword_counts[keyword] = previous + count
+            self.repeated += count - (previous == 0)
+            self.max_repetitions = max(self.max_repetitions, previous + count)
+
+        self.words += other.words
+        self.keywords += other.keywords
+        self.connectives += other.connectives
+        self.pauses += other.pauses
+        self.speech_time += other.speech_time
+
+    def vector(self) -> NDArray:
+        """The features (see FEATURES) as a float32 vector"""
+        words = max(self.words, 1)
+
+        return numpy.array(
+            [
+                self.words,
+                len(self.word_counts) / words,
+                self.repeated / max(self.keywords, 1),
+                self.max_repetitions,
+                self.connectives / words,
+                self.words / self.speech_time if self.speech_time > 0 else 0.0,
+                self.pauses,
+                self.speech_time,
+            ],
+            dtype=numpy.float32,
+        )
+
 
 class LanguageFluency:
     """Given a user input (text), determine user IELTS speaking fluency"""
 
-    def _count_repetitions(self, tokens: list[tuple[str, str]]) -> Counter[str]:
-        words = TopicModel.filter_tokens([token[0] for token in tokens])
-        return Counter(words)
+    def _count_repetitions(self, keywords: list[str]) -> Counter[str]:
+        return Counter(keywords)
 
     def _calculate_fluency_score(self, repetitions: Counter[str]) -> int:
         """Calculate the speaking fluency"""
 
-        most_frequent_number_of_repetitions = 3
+        most_frequent_number_of_repetitions = 0
 
         # TODO: Check the rules for assinging the score (1 - 9)
-        if len(repetitions.most_common(None)) != 0:
-            most_frequent_number_of_repetitions = repetitions.most_common(None)[0][1]
+        if len(repetitions) != 0:
+            most_frequent_number_of_repetitions = max(repetitions.values())
 
-        # TODO: Check the rules for assinging the score (1 - 9)
-        if most_frequent_number_of_repetitions == 1:
-            return 9
-        if most_frequent_number_of_repetitions == 2:
-            return 8
-        if most_frequent_number_of_repetitions == 3:
-            return 7
-        if most_frequent_number_of_repetitions == 3:
-            return 6
-        if most_frequent_number_of_repetitions == 3:
-            return 5
-        if most_frequent_number_of_repetitions == 3:
-            return 4
-        if most_frequent_number_of_repetitions == 3:
-            return 3
-        return 2
+        return self._score_most_repeated(most_frequent_number_of_repetitions)
+
+    def _score_most_repeated(self, most_frequent_number_of_repetitions: int) -> int:
+        """
+        Speaking fluency given how often the most repeated keyword was used
+        (0 when there are no keywords)
+        """
+        if most_frequent_number_of_repetitions == 0:
+            most_frequent_number_of_repetitions = 3
+
+        # One point less for every repetition: 9 for none, down to 2 for 8 or more
+        return max(10 - most_frequent_number_of_repetitions, 2)
+
+    def get_speech_fluency(self, features: NDArray) -> tuple[int, str]:
+        """
+        Return the speaking fluency of a whole stretch of speech, given its features
+        (see FluencyFeatures.vector). Starting from 9, points are lost for:
+        * repeating keywords (more than 30% of them)
+        * a small range of vocabulary (type-token ratio under 0.3)
+        * hardly using connectives (under 3% of the words)
+        * speaking slowly (under 1.8 words per second) or very fast (over 3.5)
+        * pausing often (more than 10 times a minute)
+        """
+        values = dict(zip(FluencyFeatures.FEATURES, features.tolist()))
+
+        if values["words"] == 0:
+            return 0, self._fluency_category(0)
+
+        penalty = max(values["repetition_rate"] - 0.3, 0) * 10
+        penalty += max(0.3 - values["type_token_ratio"], 0) * 10
+        penalty += 1 if values["connective_rate"] < 0.03 else 0
+
+        if values["speech_time"] > 0:
+            penalty += max(1.8 - values["words_per_second"], 0) * 2
+            penalty += max(values["words_per_second"] - 3.5, 0) * 2
+            penalty += max(values["pauses"] / values["speech_time"] * 60 - 10, 0) / 5
+
+        score = int(round(min(max(9 - penalty, 1), 9)))
+        return score, self._fluency_category(score)
 
     def _fluency_category(self, fluency_score: int) -> str:
         """
@@ -62,8 +195,17 @@ class LanguageFluency:
 
         return language_category
 
-    def get_fluency(self, tokens: list[tuple[str, str]]) -> tuple[int, str]:
-        """Return the speaking fluency in terms of score and category"""
-        repetitions = self._count_repetitions(tokens)
+    def get_fluency(
+        self, tokens: list[tuple[str, str]], keywords: list[str] | None = None
+    ) -> tuple[int, str]:
+        """
+        Return the speaking fluency in terms of score and category.
+        keywords are the filtered tokens (see TopicModel.filter_tokens), computed
+        from tokens when not given.
+        """
+        if keywords is None:
+            keywords = TopicModel.filter_tokens(tokens)
+
+        repetitions = self._count_repetitions(keywords)
         score = self._calculate_fluency_score(repetitions)
         return (score, self._fluency_category(score))
@@ -1,68 +1,301 @@
-import nltk
-import spacy
-from spacy.tokens.doc import Doc
-from spacy.vocab import Vocab
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from memory.databasewrapper import MetaData
 
 from memory.processing.fluency import LanguageFluency
+from utils.latency import recorder
 from utils.topic_model import TopicModel
 
 # TODO Should we consider a processing window size, or should this be determined
 # by the amount of information given? In the report we mentioned we wanted to
 # employ incremental processing.
 
-# TODO This whole thing is probably overkill, but it does help with separating
-# some of the complexites of integrating the different processing steps later,
-# so will leave it for now
-
 
 class Pipe:
-    """Abstract class which processing text and returns metadata"""
+    """
+    Abstract class which processing text and returns metadata.
+    A pipe declares the names of the values it needs (passed to process in that
+    order) and the name of the value it produces.
+    """
+
+    inputs: tuple[str, ...] = ()
+    output: str = ""
 
     def __init__(self) -> None:
         pass
 
-    def process(self, data):
+    def process(self, *data):
         """Processes the given data to generate some metadata"""
         pass
 
+    def process_batch(self, *columns: list) -> list:
+        """
+        Processes many items at once, given one list per input. Pipes override
+        this where a whole batch is cheaper than one item at a time.
+        """
+        return [self.process(*data) for data in zip(*columns)]
+
 
 class PosPipe(Pipe):
     """Performs POS tagging on given text input"""
 
+    inputs = ("text",)
+    output = "tokens"
+
     def process(self, text: str) -> list[tuple[str, str]]:
-        return nltk.pos_tag(TopicModel.cleanup_and_tokenize(text))
+        return TopicModel.pos_tag(TopicModel.cleanup_and_tokenize(text))
+
+    def process_batch(self, texts: list[str]) -> list[list[tuple[str, str]]]:
+        return TopicModel.pos_tag_sents(
+            [TopicModel.cleanup_and_tokenize(text) for text in texts]
+        )
+
+
+class KeywordPipe(Pipe):
+    """Filters tagged tokens down to lemmatized keywords (shared by later pipes)"""
+
+    inputs = ("tokens",)
+    output = "keywords"
+
+    def process(self, tokens: list[tuple[str, str]]) -> list[str]:
+        return TopicModel.filter_tokens(tokens)
 
 
 class TopicPipe(Pipe):
-    model = TopicModel()
+    inputs = ("keywords",)
+    output = "topic"
+
+    model = TopicModel.shared()
+
+    def process(self, keywords: list[str]) -> int | None:
+        return self.model.get_topic(keywords)
 
-    def process(self, tokens: list[tuple[str, str]]):
-        untagged_tokens = [token[0] for token in tokens]
-        self.model.get_topic_probability(TopicModel.preprocess(untagged_tokens))
+    def process_batch(self, keywords: list[list[str]]) -> list[int | None]:
+        return self.model.get_topics(keywords)
 
 
 class FluencyPipe(Pipe):
+    inputs = ("tokens", "keywords")
+    output = "fluency_score"
+
     fluency_scorer = LanguageFluency()
 
-    def process(self, tokens: list[tuple[str, str]]) -> int:
-        return self.fluency_scorer.get_fluency(tokens)[0]
+    def process(self, tokens: list[tuple[str, str]], keywords: list[str]) -> int:
+        return self.fluency_scorer.get_fluency(tokens, keywords)[0]
 
 
 class Pipeline:
-    """Object that will do processing of a single utterance and return meta-data"""
+    """
+    Object that will do processing of a single utterance and return meta-data.
+    The pipes are ordered by their inputs and outputs once, into stages of pipes
+    that only depend on earlier stages. Pipes in the same stage run concurrently.
+    """
+
+    INPUT = "text"
+
+    def __init__(self, pipes: list[Pipe] | None = None, max_workers: int = 4):
+        self.pipes: list[Pipe] = (
+            pipes
+            if pipes is not None
+            else [PosPipe(), KeywordPipe(), TopicPipe(), FluencyPipe()]
+        )
+        self.stages = Pipeline._schedule(self.pipes)
+        self.max_workers = max_workers
+
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
 
-    def __init__(self):
-        self.pipes: list[Pipe] = [PosPipe(), TopicPipe(), FluencyPipe()]
+    def set_topic_model(self, model: TopicModel):
+        """Makes the topic pipe(s) use the given topic model"""
+        for pipe in self.pipes:
+            if isinstance(pipe, TopicPipe):
+                pipe.model = model
 
-    def process(self, text: str) -> tuple[list[tuple[str, str]], MetaData]:
+    def process(
+        self, text: str, known: dict | None = None
+    ) -> tuple[list[tuple[str, str]], MetaData]:
+        """Processes the given text according to the constructed pipeline"""
+        values = self.run(text, known)
+
+        return values["tokens"], MetaData(
+            values.get("topic"), values.get("fluency_score"), outputs=values
+        )
+
+    def process_batch(
+        self, texts: list[str], chunk_size: int = 256, processes: int | None = None
+    ) -> list[tuple[list[tuple[str, str]], MetaData]]:
         """
-        Processes the given text according to the constructed pipeline
-        TODO Automatically construct dependency graph based on dependencies
+        Processes many texts, each stage handling whole lists at once. The results
+        are the same as those of process. With processes > 1, chunks of chunk_size
+        texts are spread over a pool of worker processes, each running a pipeline
+        of the same pipe types.
         """
-        tokens = self.pipes[0].process(text)
-        #print(tokens)
-        current_topic = self.pipes[1].process(tokens)
-        fluency_score = self.pipes[2].process(tokens)
+        if processes is None or processes <= 1 or len(texts) <= chunk_size:
+            columns = self.run_batch(texts)
+        else:
+            columns = self._run_batch_in_pool(texts, chunk_size, processes)
+
+        return [
+            (
+                values["tokens"],
+                MetaData(
+                    values.get("topic"), values.get("fluency_score"), outputs=values
+                ),
+            )
+            for values in (
+                {name: column[i] for name, column in columns.items()}
+                for i in range(len(texts))
+            )
+        ]
+
+    def run_batch(self, texts: list[str]) -> dict[str, list]:
+        """Returns the outputs of every pipe by name, as one list per output"""
+        columns: dict[str, list] = {Pipeline.INPUT: list(texts)}
+
+        for stage in self.stages:
+            if len(stage) == 1:
+                columns[stage[0].output] = Pipeline._run_pipe_batch(stage[0], columns)
+                continue
+
+            futures = [
+                self._get_executor().submit(Pipeline._run_pipe_batch, pipe, columns)
+                for pipe in stage
+            ]
+
+            for pipe, future in zip(stage, futures):
+                columns[pipe.output] = future.result()
+
+        del columns[Pipeline.INPUT]
+        return columns
+
+    def _run_batch_in_pool(
+        self, texts: list[str], chunk_size: int, processes: int
+    ) -> dict[str, list]:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunks = [
+            texts[start : start + chunk_size]
+            for start in range(0, len(texts), chunk_size)
+        ]
+        topic_model = next(
+            (pipe.model.path for pipe in self.pipes if isinstance(pipe, TopicPipe)),
+            None,
+        )
+
+        with ProcessPoolExecutor(
+            processes,
+            initializer=_init_worker,
+            initargs=([type(pipe) for pipe in self.pipes], topic_model),
+        ) as pool:
+            results = list(pool.map(_run_chunk, chunks))
+
+        return {
+            name: [value for result in results for value in result[name]]
+            for name in results[0]
+        }
+
+    def run(self, text: str, known: dict | None = None) -> dict:
+        """
+        Returns the output of every pipe by name. Outputs that are already known
+        can be given, the pipes producing them are then skipped.
+        """
+        values: dict = {Pipeline.INPUT: text}
+
+        if known is not None:
+            values.update(known)
+
+        for stage in self.stages:
+            stage = [pipe for pipe in stage if pipe.output not in values]
+
+            if len(stage) == 0:
+                continue
+
+            if len(stage) == 1:
+                values[stage[0].output] = Pipeline._run_pipe(stage[0], values)
+                continue
+
+            futures = [
+                self._get_executor().submit(Pipeline._run_pipe, pipe, values)
+                for pipe in stage
+            ]
+
+            for pipe, future in zip(stage, futures):
+                values[pipe.output] = future.result()
+
+        del values[Pipeline.INPUT]
+        return values
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        self.max_workers, thread_name_prefix="pipeline"
+                    )
+
+        return self._executor
+
+    @staticmethod
+    def _run_pipe(pipe: Pipe, values: dict):
+        with recorder.measure("pipe." + type(pipe).__name__):
+            return pipe.process(*(values[name] for name in pipe.inputs))
+
+    @staticmethod
+    def _run_pipe_batch(pipe: Pipe, columns: dict) -> list:
+        with recorder.measure("pipe_batch." + type(pipe).__name__):
+            return pipe.process_batch(*(columns[name] for name in pipe.inputs))
+
+    @staticmethod
+    def _schedule(pipes: list[Pipe]) -> list[list[Pipe]]:
+        """Orders the pipes into stages, each only depending on earlier ones"""
+        producers = {pipe.output: pipe for pipe in pipes}
+
+        if len(producers) != len(pipes):
+            raise ValueError("Every pipe must produce a differently named output")
+
+        for pipe in pipes:
+            for name in pipe.inputs:
+                if name != Pipeline.INPUT and name not in producers:
+                    raise ValueError(
+                        f"{type(pipe).__name__} needs '{name}', which no pipe produces"
+                    )
+
+        available = {Pipeline.INPUT}
+        remaining = list(pipes)
+        stages: list[list[Pipe]] = []
+
+        while len(remaining) != 0:
+            stage = [
+                pipe
+                for pipe in remaining
+                if all(name in available for name in pipe.inputs)
+            ]
+
+            if len(stage) == 0:
+                raise ValueError("The pipes depend on each other in a cycle")
+
+            stages.append(stage)
+            available.update(pipe.output for pipe in stage)
+            remaining = [pipe for pipe in remaining if pipe not in stage]
+
+        return stages
+
+
+# Pipeline of a process_batch worker process
+_worker_pipeline: Pipeline | None = None
+
+
+def _init_worker(pipe_types: list[type], topic_model: str | None) -> None:
+    global _worker_pipeline
+    _worker_pipeline = Pipeline([pipe_type() for pipe_type in pipe_types])
+
+    if topic_model is not None:
+        _worker_pipeline.set_topic_model(TopicModel.shared(topic_model))
+
 
-        return tokens, MetaData(current_topic, fluency_score)
+def _run_chunk(texts: list[str]) -> dict[str, list]:
+    assert _worker_pipeline is not None
+    return _worker_pipeline.run_batch(texts)
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from numpy._typing import NDArray
+
+from memory.databasewrapper import MetaData
+from memory.processing.fluency import FluencyFeatures, LanguageFluency
+from memory.processing.pipeline import Pipeline
+from memory.topictracker import TopicTracker
+from utils.topic_model import TopicModel
+
+
+class StreamingProcessor:
+    """
+    Incremental processing of one speech turn, fed fragment by fragment (every
+    result of listen()). Every fragment is processed by the pipeline on its own,
+    and adds its tokens to the turn's fluency features and its keywords to the
+    topic tracker, so the fluency and topic of the turn so far are known after
+    every fragment at a cost that only depends on the size of that fragment.
+
+    listen() returns when the speaker pauses, so every gap between two fragments
+    of a turn is one pause, however many listen() calls heard nothing in between.
+    """
+
+    # Number of words of the previous fragment that are tagged along with the
+    # next one, as the tagger looks at the two words before a word
+    CONTEXT = 2
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        topic_tracker: TopicTracker,
+        fluency_scorer: LanguageFluency | None = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.topic_tracker = topic_tracker
+        self.fluency_scorer = (
+            fluency_scorer if fluency_scorer is not None else LanguageFluency()
+        )
+
+        self.features = FluencyFeatures()
+
+        self._context: list[str] = []
+        self._fragments = 0
+        self._ended = False
+
+    def __len__(self) -> int:
+        """Number of fragments in the turn"""
+        return self._fragments
+
+    @property
+    def ended(self) -> bool:
+        return self._ended
+
+    def reset(self) -> None:
+        """Starts a new speech turn (the topic tracker is left as it is)"""
+        self.features = FluencyFeatures()
+        self._context = []
+        self._fragments = 0
+        self._ended = False
+
+    def end(self, speech_time: float | None = None) -> None:
+        """
+        Ends the turn (lasting speech_time seconds, if known). Its estimates are
+        kept until the next fragment is fed.
+        """
+        if speech_time is not None and not self._ended:
+            self.features.add_speech_time(speech_time)
+
+        self._ended = True
+
+    def feed(
+        self, text: str, timestamp: float
+    ) -> tuple[list[tuple[str, str]], MetaData]:
+        """
+        Processes the next fragment of the turn and updates the turn's estimates.
+        Returns the tokens and metadata of the fragment itself, like Pipeline.process.
+        """
+        if self._ended:
+            self.reset()
+
+        tokens = self._tag(TopicModel.cleanup_and_tokenize(text))
+        tokens, metadata = self.pipeline.process(text, {"tokens": tokens})
+        keywords: list[str] = metadata.outputs["keywords"]
+
+        # Every fragment after the first one started after the speaker paused
+        if self._fragments != 0:
+            self.features.add_pause()
+
+        self.features.add(tokens, keywords)
+        self.topic_tracker.add(keywords, timestamp)
+        self._fragments += 1
+
+        return tokens, metadata
+
+    @property
+    def fluency(self) -> tuple[int, str]:
+        """Fluency score and category of the turn so far"""
+        return self.fluency_scorer.get_speech_fluency(self.features.vector())
+
+    @property
+    def topic(self) -> int | None:
+        """Dominant topic of the recent speech (see TopicTracker)"""
+        return self.topic_tracker.topic
+
+    @property
+    def distribution(self) -> NDArray | None:
+        return self.topic_tracker.distribution
+
+    def _tag(self, words: list[str]) -> list[tuple[str, str]]:
+        """Tags the words of a fragment after the last words of the previous one"""
+        if len(words) == 0:
+            return []
+
+        tagged = TopicModel.pos_tag(self._context + words)[len(self._context) :]
+        self._context = (self._context + words)[-self.CONTEXT :]
+
+        return tagged
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import os
+from random import Random
+
+
+class QuestionBank:
+    """
+    Cached view of the question bank csv.
+    The file is parsed once into arrays of cue cards and (pre-split) follow-up
+    questions, and is reloaded automatically when its modification time changes.
+    """
+
+    def __init__(self, path: str, rng: Random | None = None) -> None:
+        self.path = path
+        self._rng = rng if rng is not None else Random()
+        self._stamp: tuple[int, int] | None = None
+        self._cards: tuple[str, ...] = ()
+        self._follow_ups: tuple[tuple[str, ...], ...] = ()
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._cards)
+
+    @property
+    def fingerprint(self) -> tuple[int, int]:
+        """(mtime, size) of the loaded file, changes whenever the question bank does"""
+        self._refresh()
+        assert self._stamp is not None
+        return self._stamp
+
+    @property
+    def cards(self) -> tuple[str, ...]:
+        self._refresh()
+        return self._cards
+
+    def random(self) -> tuple[str, int]:
+        """Returns a random cue card along with its _id"""
+        self._refresh()
+        _id = self._rng.randrange(len(self._cards))
+        return self._cards[_id], _id
+
+    def cue_card(self, _id: int) -> str:
+        self._refresh()
+        return self._cards[_id]
+
+    def follow_ups(self, _id: int) -> list[str]:
+        self._refresh()
+        return list(self._follow_ups[_id])
+
+    def _refresh(self) -> None:
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        if stamp != self._stamp:
+            self._load()
+            self._stamp = stamp
+
+    def _load(self) -> None:
+        import pandas as pd
+
+        reader = pd.read_csv(self.path)
+
+        self._cards = tuple(reader["topic"].tolist())
+        self._follow_ups = tuple(
+            tuple(questions.split("|")) for questions in reader["questions"].tolist()
+        )
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Iterator
+
+from memory.databasewrapper import Utterance
+
+
+class ShortTermMemory:
+    """
+    In-process short-term memory of the current session.
+    Holds the most recent utterances in a ring buffer so the dialog can look
+    at them without querying the database.
+    """
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.utterances: deque[Utterance] = deque(maxlen=capacity)
+
+    def __len__(self) -> int:
+        return len(self.utterances)
+
+    def __iter__(self) -> Iterator[Utterance]:
+        return iter(self.utterances)
+
+    def add(self, utterance: Utterance) -> None:
+        self.utterances.append(utterance)
+
+    def last(self) -> Utterance | None:
+        """Returns the most recently added utterance"""
+        return self.utterances[-1] if len(self.utterances) != 0 else None
+
+    def clear(self) -> None:
+        self.utterances.clear()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from collections import deque
+
+from numpy._typing import NDArray
+
+from utils.topic_model import TopicModel
+
+
+class TopicTracker:
+    """
+    Topic distribution of the most recent speech. Keeps a running bag of words
+    over a sliding window of fragments (bounded by tokens and/or seconds): new
+    fragments are preprocessed once and add their counts, expired ones subtract
+    theirs. Inference only runs on the window, so its cost does not grow with
+    the length of the speech.
+    """
+
+    def __init__(
+        self,
+        topic_model: TopicModel,
+        max_tokens: int | None = 100,
+        max_seconds: float | None = None,
+    ) -> None:
+        self.topic_model = topic_model
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+
+        self._fragments: deque[tuple[float, list[int]]] = deque()
+        self._counts: dict[int, int] = {}
+        self._tokens = 0
+        self._distribution: NDArray | None = None
+        self._topic = 0
+
+    def __len__(self) -> int:
+        """Number of known tokens in the window"""
+        return self._tokens
+
+    @property
+    def distribution(self) -> NDArray | None:
+        """Topic distribution of the window, None while it is empty"""
+        return self._distribution
+
+    @property
+    def topic(self) -> int | None:
+        """Dominant topic of the window"""
+        return self._topic if self._distribution is not None else None
+
+    def clear(self) -> None:
+        self._fragments.clear()
+        self._counts.clear()
+        self._tokens = 0
+        self._distribution = None
+
+    def add(self, tokens: list[str] | list[tuple[str, str]], timestamp: float) -> None:
+        """Adds a fragment (tagged tokens are preprocessed first) and updates the topics"""
+        if len(tokens) != 0 and isinstance(tokens[0], tuple):
+            tokens = TopicModel.filter_tokens(tokens)
+
+        token2id = self.topic_model.token2id
+        ids = [token2id[token] for token in tokens if token in token2id]
+
+        self._fragments.append((timestamp, ids))
+        self._count(ids, 1)
+        self._expire(timestamp)
+        self._update()
+
+    def on_topic_probability(self, reference: NDArray) -> float:
+        """
+        Likelihood of the reference distribution (e.g. the cue card's) for the
+        dominant topic of the window, relative to that of the window itself
+        """
+        if self._distribution is None:
+            return 1.0
+
+        return float(reference[self._topic] / self._distribution[self._topic])
+
+    def _count(self, ids: list[int], sign: int) -> None:
+        for _id in ids:
+            count = self._counts.get(_id, 0) + sign
+
+            if count == 0:
+                del self._counts[_id]
+            else:
+                self._counts[_id] = count
+
+        self._tokens += sign * len(ids)
+
+    def _expire(self, now: float) -> None:
+        """Drops the oldest fragments outside the window, but never the newest"""
+        while len(self._fragments) > 1:
+            timestamp, ids = self._fragments[0]
+
+            too_many = self.max_tokens is not None and self._tokens > self.max_tokens
+            too_old = (
+                self.max_seconds is not None and now - timestamp > self.max_seconds
+            )
+
+            if not too_many and not too_old:
+                break
+
+            self._fragments.popleft()
+            self._count(ids, -1)
+
+    def _update(self) -> None:
+        if len(self._counts) == 0:
+            self._distribution = None
+            return
+
+        self._distribution = self.topic_model.infer([list(self._counts.items())])[0]
+        self._topic = int(self._distribution.argmax())
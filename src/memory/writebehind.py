@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable
+
+
+class PartialWriteException(Exception):
+    """Exception that indicates only some documents of a batch could not be written"""
+
+    def __init__(self, args, failed: list[dict]):
+        super().__init__(*args)
+        self.failed = failed
+
+
+class WriteBehindQueue:
+    """
+    Buffers documents and writes them in batches on a background thread.
+    A batch is written as soon as batch_size documents are pending, or once the
+    oldest pending document has waited max_latency seconds. flush() writes
+    everything that is pending synchronously.
+    When write fails the batch is queued again, or only the documents it could not
+    write if it raises PartialWriteException. close() stops the background thread.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[dict]], object],
+        batch_size: int = 32,
+        max_latency: float = 0.5,
+        name: str = "write-behind",
+    ) -> None:
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+
+        self._write = write
+        self._pending: list[dict] = []
+        self._oldest: float | None = None  # time the oldest pending document was queued
+        self._closed = False
+
+        self._condition = threading.Condition()
+        # Held while writing, so batches are written in order and flush() waits
+        # for a batch that is being written by the background thread
+        self._write_lock = threading.Lock()
+
+        self._enqueued = 0
+        self._written = 0
+        self._batches = 0
+        self._errors = 0
+        self._max_depth = 0
+        self.last_error: Exception | None = None
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        """Number of documents waiting to be written"""
+        return len(self._pending)
+
+    def metrics(self) -> dict[str, int]:
+        with self._condition:
+            return {
+                "depth": len(self._pending),
+                "max_depth": self._max_depth,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "batches": self._batches,
+                "errors": self._errors,
+            }
+
+    def put(self, document: dict) -> None:
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot queue a document on a closed queue")
+
+            if len(self._pending) == 0:
+                self._oldest = time.monotonic()
+
+            self._pending.append(document)
+            self._enqueued += 1
+            self._max_depth = max(self._max_depth, len(self._pending))
+
+            # Wake the writer to start the latency timer or write a full batch
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def flush(self) -> None:
+        """Writes all pending documents before returning"""
+        with self._write_lock:
+            batch = self._take()
+
+            if len(batch) != 0:
+                self._write_batch(batch)
+
+    def close(self) -> None:
+        """Stops the background thread after writing everything that is pending"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+        self._thread.join()
+        self.flush()
+
+    def _take(self) -> list[dict]:
+        with self._condition:
+            batch = self._pending
+            self._pending = []
+            self._oldest = None
+            return batch
+
+    def _write_batch(self, batch: list[dict]) -> None:
+        try:
+            self._write(batch)
+        except Exception as e:
+            failed = e.failed if isinstance(e, PartialWriteException) else batch
+
+            # Put what failed back in front so nothing is lost or reordered
+            with self._condition:
+                self._pending = failed + self._pending
+                self._oldest = time.monotonic()
+                self._written += len(batch) - len(failed)
+                self._errors += 1
+                self.last_error = e
+            raise
+
+        with self._condition:
+            self._written += len(batch)
+            self._batches += 1
+
+    def _wait_for_batch(self) -> bool:
+        """Blocks until a batch is due, returns False once the queue is closed"""
+        with self._condition:
+            while not self._closed:
+                if len(self._pending) >= self.batch_size:
+                    return True
+
+                if self._oldest is None:
+                    self._condition.wait()
+                    continue
+
+                remaining = self.max_latency - (time.monotonic() - self._oldest)
+
+                if remaining <= 0:
+                    return True
+
+                self._condition.wait(remaining)
+
+            return False
+
+    def _run(self) -> None:
+        while self._wait_for_batch():
+            try:
+                self.flush()
+            except Exception:
+                # Back off before retrying, the error is kept in last_error
+                time.sleep(self.max_latency)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Compares the stored size and decode time of pickled tokens and face encodings
+with the binary formats of memory.encoding. Run from the repository root with
+`PYTHONPATH=./src python -m tools.bench_encoding`.
+"""
+
+import argparse
+import pickle
+import random
+import string
+import timeit
+
+import bson
+import numpy
+
+from memory.encoding import (
+    PENN_TAGS,
+    Vocabulary,
+    decode_face_encodings,
+    decode_tokens,
+    encode_face_encodings,
+    encode_tokens,
+)
+
+
+def random_tokens(
+    rng: random.Random, words: list[str], n: int
+) -> list[tuple[str, str]]:
+    return [(rng.choice(words), rng.choice(PENN_TAGS)) for _ in range(n)]
+
+
+def report(name: str, pickled: dict, encoded: dict, decode_pickle, decode, number):
+    pickled_size = len(bson.encode(pickled))
+    encoded_size = len(bson.encode(encoded))
+    pickled_time = timeit.timeit(decode_pickle, number=number) / number * 1e6
+    encoded_time = timeit.timeit(decode, number=number) / number * 1e6
+
+    print(
+        "{:<28} {:>8} B {:>8} B {:>10.1f} us {:>10.1f} us".format(
+            name, pickled_size, encoded_size, pickled_time, encoded_time
+        )
+    )
+
+
+def main(utterance_length: int, vocabulary_size: int, number: int):
+    rng = random.Random(0)
+    words = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+        for _ in range(vocabulary_size)
+    ]
+    tokens = random_tokens(rng, words, utterance_length)
+
+    vocabulary = Vocabulary()
+    for _ in range(50):  # earlier utterances of the session
+        encode_tokens(random_tokens(rng, words, utterance_length), vocabulary)
+
+    face = numpy.random.default_rng(0).normal(0, 0.1, 128)
+
+    print(
+        "{:<28} {:>10} {:>10} {:>13} {:>13}".format(
+            "", "pickle", "binary", "pickle load", "binary load"
+        )
+    )
+
+    pickled_tokens = pickle.dumps(tokens)
+    inline = {"tokens": encode_tokens(tokens)}
+    report(
+        "tokens (inline words)",
+        {"tokens": pickled_tokens},
+        inline,
+        lambda: pickle.loads(pickled_tokens),
+        lambda: decode_tokens(inline["tokens"]),
+        number,
+    )
+
+    interned = {"tokens": encode_tokens(tokens, vocabulary)}
+    report(
+        "tokens (session vocabulary)",
+        {"tokens": pickled_tokens},
+        interned,
+        lambda: pickle.loads(pickled_tokens),
+        lambda: decode_tokens(interned["tokens"], vocabulary),
+        number,
+    )
+
+    pickled_face = pickle.dumps(face)
+    encoded_face = {"face_encodings": encode_face_encodings(face)}
+    report(
+        "face encodings (128-d)",
+        {"face_encodings": pickled_face},
+        encoded_face,
+        lambda: pickle.loads(pickled_face),
+        lambda: decode_face_encodings(encoded_face["face_encodings"]),
+        number,
+    )
+
+
+if __name__ == "__main__":
+    all_args = argparse.ArgumentParser(description=__doc__)
+    all_args.add_argument(
+        "--utterance-length",
+        type=int,
+        default=40,
+        help="Number of tokens per utterance (default 40)",
+    )
+    all_args.add_argument(
+        "--vocabulary-size",
+        type=int,
+        default=500,
+        help="Number of distinct words (default 500)",
+    )
+    all_args.add_argument(
+        "-n",
+        "--number",
+        type=int,
+        default=10000,
+        help="Decodes per measurement (default 10000)",
+    )
+    args = vars(all_args.parse_args())
+
+    main(args["utterance_length"], args["vocabulary_size"], args["number"])
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Measures the per-utterance cost of the text normalization, tokenization and
+stopword removal of TopicModel against the implementation it replaced. Run
+from the repository root with `PYTHONPATH=./src python -m tools.bench_preprocessing`.
+"""
+
+import argparse
+import re
+import timeit
+
+from utils.topic_model import EXTRA_STOPWORDS, TopicModel, require_nltk
+
+UTTERANCES = [
+    "Well, I think my favourite book is probably The Hobbit, which I read when I was 12.",
+    "I cannot remember exactly, but we were gonna travel to Spain in 2019 with my family",
+    "My hometown is quite a small city; it's famous for its old market and the river.",
+    "To be honest I'd like to use public transport more often because it's cheaper",
+]
+
+
+def legacy_cleanup_and_tokenize(text: str) -> list[str]:
+    import nltk
+
+    text = re.sub(r"[^a-zA-Z0-9]", " ", text)
+    text = text.lower()
+    text = "".join([i for i in text if not i.isdigit()])
+    return nltk.word_tokenize(text)
+
+
+def legacy_remove_stopwords(document: list[str]) -> list[str]:
+    import nltk
+    from gensim.utils import simple_preprocess
+
+    stop_words = nltk.corpus.stopwords.words("english")
+    stop_words.extend(EXTRA_STOPWORDS)
+
+    return [word for word in simple_preprocess(str(document)) if word not in stop_words]
+
+
+def measure(function, number: int) -> float:
+    """Average time per utterance in microseconds"""
+
+    def run():
+        for utterance in UTTERANCES:
+            function(utterance)
+
+    return timeit.timeit(run, number=number) / (number * len(UTTERANCES)) * 1e6
+
+
+def main(number: int):
+    require_nltk("punkt", "stopwords")
+    tokenized = {text: TopicModel.cleanup_and_tokenize(text) for text in UTTERANCES}
+
+    for text in UTTERANCES:
+        assert legacy_cleanup_and_tokenize(text) == tokenized[text]
+        assert legacy_remove_stopwords(tokenized[text]) == TopicModel._remove_stopwords(
+            tokenized[text]
+        )
+
+    stages = [
+        (
+            "normalize + tokenize",
+            legacy_cleanup_and_tokenize,
+            TopicModel.cleanup_and_tokenize,
+        ),
+        (
+            "stopword removal",
+            lambda text: legacy_remove_stopwords(tokenized[text]),
+            lambda text: TopicModel._remove_stopwords(tokenized[text]),
+        ),
+    ]
+
+    print("{:<24} {:>12} {:>12}".format("", "before", "after"))
+
+    for name, before, after in stages:
+        print(
+            "{:<24} {:>9.1f} us {:>9.1f} us".format(
+                name, measure(before, number), measure(after, number)
+            )
+        )
+
+
+if __name__ == "__main__":
+    all_args = argparse.ArgumentParser(description=__doc__)
+    all_args.add_argument(
+        "-n",
+        "--number",
+        type=int,
+        default=2000,
+        help="Repetitions of the sample utterances (default 2000)",
+    )
+    args = vars(all_args.parse_args())
+
+    main(args["number"])
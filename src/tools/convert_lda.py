@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Converts pickled LDA models to gensim's own format, which stores the large
+arrays as separate .npy files. TopicModel loads converted models with
+mmap='r', so every process on a host shares one read-only copy of the
+topic-word matrix and startup does not unpickle it. Run from the repository
+root with `PYTHONPATH=./src python -m tools.convert_lda assets/topic_model/LDA_model_32`.
+"""
+
+import argparse
+import os
+
+import numpy
+
+from utils.level_logging import CustomFormatter
+from utils.topic_model import TopicModel, TopicModelException
+
+logger = CustomFormatter.init_logger(__name__)
+
+
+def convert(path: str, output: str) -> None:
+    from gensim.models import LdaModel
+
+    if os.path.exists(output + ".expElogbeta.npy"):
+        raise TopicModelException([f"{output} is already converted"])
+
+    model = TopicModel(path).model
+
+    # Store every array separately, however small, so all of them can be mapped.
+    # The random state is replaced by TopicModel when loading, so it is not stored.
+    model.save(output, ignore=("random_state",), sep_limit=0)
+
+    converted = LdaModel.load(output, mmap="r")
+    assert numpy.array_equal(converted.expElogbeta, model.expElogbeta)
+
+
+def main(paths: list[str], output_dir: str | None):
+    for path in paths:
+        output = (
+            path
+            if output_dir is None
+            else os.path.join(output_dir, os.path.basename(path))
+        )
+
+        try:
+            convert(path, output)
+        except TopicModelException as e:
+            logger.error(e)
+        else:
+            logger.info("Converted {} to {}".format(path, output))
+
+
+if __name__ == "__main__":
+    all_args = argparse.ArgumentParser(description=__doc__)
+    all_args.add_argument("models", nargs="+", help="Pickled LDA models to convert")
+    all_args.add_argument(
+        "--output-dir",
+        default=None,
+        help="Directory to write the converted models to (default: in place)",
+    )
+    args = vars(all_args.parse_args())
+
+    main(args["models"], args["output_dir"])
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Migrates stored users, sessions and utterances from pickled values to the
+binary formats of memory.encoding. Run from the repository root with
+`PYTHONPATH=./src python -m tools.migrate_encoding`.
+"""
+
+import argparse
+import pickle
+
+from pymongo import MongoClient
+
+from memory.databasewrapper import Database
+from memory.encoding import encode_face_encodings, encode_tokens
+from utils.level_logging import CustomFormatter
+
+logger = CustomFormatter.init_logger(__name__)
+
+LEGACY = {"$type": "binData"}
+
+
+def migrate_users(db, dry_run: bool) -> int:
+    count = 0
+
+    for obj in db["users"].find({"face_encodings": LEGACY}):
+        # Only ever unpickle data written by this application
+        encodings = pickle.loads(obj["face_encodings"])
+
+        if not dry_run:
+            db["users"].update_one(
+                {"_id": obj["_id"]},
+                {"$set": {"face_encodings": encode_face_encodings(encodings)}},
+            )
+        count += 1
+
+    return count
+
+
+def migrate_sessions(db, dry_run: bool) -> int:
+    """Replaces users embedded in sessions by a reference"""
+    count = 0
+
+    for obj in db["sessions"].find(
+        {"user.face_encodings": {"$exists": True}}, {"user._id": 1}
+    ):
+        if not dry_run:
+            db["sessions"].update_one(
+                {"_id": obj["_id"]}, {"$set": {"user": {"_id": obj["user"]["_id"]}}}
+            )
+        count += 1
+
+    return count
+
+
+def migrate_utterances(db, dry_run: bool) -> int:
+    """Utterances left over in short-term memory keep their words inline"""
+    count = 0
+
+    for obj in db["utterances"].find({"tokens": LEGACY}, {"tokens": 1}):
+        tokens = pickle.loads(obj["tokens"])
+
+        if not dry_run:
+            db["utterances"].update_one(
+                {"_id": obj["_id"]}, {"$set": {"tokens": encode_tokens(tokens)}}
+            )
+        count += 1
+
+    return count
+
+
+def main(connection_string: str, db_name: str, dry_run: bool):
+    db = MongoClient(connection_string)[db_name]
+
+    if dry_run:
+        logger.info("Dry run, nothing will be written")
+
+    logger.info("Users migrated: {}".format(migrate_users(db, dry_run)))
+    logger.info("Sessions migrated: {}".format(migrate_sessions(db, dry_run)))
+    logger.info("Utterances migrated: {}".format(migrate_utterances(db, dry_run)))
+
+
+if __name__ == "__main__":
+    all_args = argparse.ArgumentParser(description=__doc__)
+    all_args.add_argument(
+        "--connection-string",
+        default=Database.CONNECTION_STRING,
+        help="MongoDB connection string (default {})".format(
+            Database.CONNECTION_STRING
+        ),
+    )
+    all_args.add_argument(
+        "--db-name",
+        default="agent_illy",
+        help="Name of the database to migrate (default agent_illy)",
+    )
+    all_args.add_argument(
+        "--dry-run",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Only count the documents that would be migrated",
+    )
+    args = vars(all_args.parse_args())
+
+    main(args["connection_string"], args["db_name"], args["dry_run"])
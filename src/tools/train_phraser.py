@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Trains the bigram and trigram phrase models used by TopicModel on the corpus
+written by assets/ielts-data-scraper.py, and saves them frozen next to the
+topic model. Run from the repository root with
+`PYTHONPATH=./src python -m tools.train_phraser <corpus.csv>`.
+"""
+
+import argparse
+import csv
+from typing import Iterator
+
+from utils.level_logging import CustomFormatter
+from utils.topic_model import TopicModel, load_phrasers
+
+logger = CustomFormatter.init_logger(__name__)
+
+
+def read_corpus(path: str) -> Iterator[list[str]]:
+    """Yields every paragraph of the corpus, preprocessed as TopicModel does"""
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+
+            for paragraph in row[1].split("|"):
+                tokens = TopicModel._remove_stopwords(
+                    TopicModel.cleanup_and_tokenize(paragraph)
+                )
+
+                if len(tokens) != 0:
+                    yield tokens
+
+
+def train(
+    sentences: list[list[str]], min_count: int, threshold: float, trigrams: bool
+) -> list:
+    from gensim.models.phrases import Phrases
+
+    bigram = Phrases(sentences, min_count=min_count, threshold=threshold).freeze()
+    phrasers = [bigram]
+
+    if trigrams:
+        trigram = Phrases(
+            bigram[sentences], min_count=min_count, threshold=threshold
+        ).freeze()
+        phrasers.append(trigram)
+
+    return phrasers
+
+
+def main(corpus: str, min_count: int, threshold: float, trigrams: bool):
+    sentences = list(read_corpus(corpus))
+    logger.info("Read {} paragraphs from {}".format(len(sentences), corpus))
+
+    phrasers = train(sentences, min_count, threshold, trigrams)
+
+    for phraser, path in zip(phrasers, TopicModel.PHRASER_PATHS):
+        phraser.save(path)
+        logger.info("Saved {} phrases to {}".format(len(phraser.phrasegrams), path))
+
+    load_phrasers.cache_clear()
+
+
+if __name__ == "__main__":
+    all_args = argparse.ArgumentParser(description=__doc__)
+    all_args.add_argument("corpus", help="CSV file written by the scraper")
+    all_args.add_argument(
+        "--min-count",
+        type=int,
+        default=5,
+        help="Ignore words and phrases seen fewer times (default 5)",
+    )
+    all_args.add_argument(
+        "--threshold",
+        type=float,
+        default=100,
+        help="Score a phrase needs to be kept, higher means fewer phrases "
+        "(default 100)",
+    )
+    all_args.add_argument(
+        "--trigrams",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Also train a trigram model on top of the bigrams (default on)",
+    )
+    args = vars(all_args.parse_args())
+
+    main(args["corpus"], args["min_count"], args["threshold"], args["trigrams"])
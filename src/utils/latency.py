@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import functools
+import logging
+import math
+import threading
+import time
+from contextlib import AbstractContextManager, nullcontext
+from typing import Callable, TypeVar
+
+from utils.level_logging import CustomFormatter
+
+F = TypeVar("F", bound=Callable)
+
+logger = CustomFormatter.init_logger(__name__)
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies in logarithmic buckets, four per doubling (so within
+    19% of the real value) from 1 microsecond up to about 18 minutes. Recording is
+    O(1) and the memory used is fixed, however many latencies are recorded.
+    """
+
+    MIN = 1e-6  # seconds, upper bound of the first bucket
+    BUCKETS_PER_DOUBLING = 4
+    BUCKETS = 120
+
+    def __init__(self) -> None:
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        if seconds <= self.MIN:
+            bucket = 0
+        else:
+            bucket = min(
+                math.ceil(math.log2(seconds / self.MIN) * self.BUCKETS_PER_DOUBLING),
+                self.BUCKETS - 1,
+            )
+
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound (in seconds) of the bucket holding the q-th percentile"""
+        if self.count == 0:
+            return 0.0
+
+        rank = q / 100 * self.count
+        seen = 0
+
+        for bucket, count in enumerate(self.counts):
+            seen += count
+
+            if seen >= rank and count != 0:
+                bound = self.MIN * 2 ** (bucket / self.BUCKETS_PER_DOUBLING)
+                return min(bound, self.max)
+
+        return self.max
+
+    def stats(self) -> dict[str, float]:
+        """Statistics in milliseconds"""
+        if self.count == 0:
+            return {"count": 0}
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count * 1000,
+            "p50": self.percentile(50) * 1000,
+            "p95": self.percentile(95) * 1000,
+            "p99": self.percentile(99) * 1000,
+            "max": self.max * 1000,
+        }
+
+
+class LatencyRecorder:
+    """
+    Latency histograms per named stage (e.g. "pipe.PosPipe", "db.insert_utterance").
+    Disabled by default, the timers then only check the enabled flag.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+
+        self._histograms: dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        self._logging: threading.Event | None = None
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        self.stop_logging()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(stage)
+
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+
+            histogram.record(seconds)
+
+    def measure(self, stage: str) -> AbstractContextManager:
+        """Context manager that records the latency of its body as stage"""
+        return _Timer(self, stage) if self.enabled else _NOT_TIMED
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Statistics (in milliseconds, see LatencyHistogram.stats) of every stage"""
+        with self._lock:
+            return {
+                stage: histogram.stats()
+                for stage, histogram in sorted(self._histograms.items())
+            }
+
+    def summary(self) -> str:
+        """One line with p50/p95/p99 (in milliseconds) and count of every stage"""
+        return "; ".join(
+            f"{stage} {s['p50']:.2f}/{s['p95']:.2f}/{s['p99']:.2f}ms n={s['count']}"
+            for stage, s in self.stats().items()
+            if s["count"] != 0
+        )
+
+    def start_logging(
+        self, interval: float = 60.0, log: logging.Logger | None = None
+    ) -> None:
+        """Logs the summary every interval seconds (to log, or this module's logger)"""
+        self.stop_logging()
+
+        log = log if log is not None else logger
+        stopped = self._logging = threading.Event()
+
+        def run() -> None:
+            while not stopped.wait(interval):
+                if self.enabled:
+                    log.info("latency p50/p95/p99: %s", self.summary())
+
+        threading.Thread(target=run, name="latency-log", daemon=True).start()
+
+    def stop_logging(self) -> None:
+        if self._logging is not None:
+            self._logging.set()
+            self._logging = None
+
+
+class _Timer:
+    __slots__ = ("recorder", "stage", "start")
+
+    def __init__(self, recorder: LatencyRecorder, stage: str) -> None:
+        self.recorder = recorder
+        self.stage = stage
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.recorder.record(self.stage, time.perf_counter() - self.start)
+
+
+_NOT_TIMED = nullcontext()
+
+# Recorder shared by everything that is instrumented
+recorder = LatencyRecorder()
+
+
+def timed(stage: str) -> Callable[[F], F]:
+    """Decorator that records the latency of every call of a function as stage"""
+
+    def decorator(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recorder.record(stage, time.perf_counter() - start)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
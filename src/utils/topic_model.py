@@ -1,49 +1,455 @@
+import itertools
+import math
+import os
 import pickle
-from gensim.test.utils import common_dictionary
-from spacy.tokens.doc import Doc
+import pickletools
 import re
-import nltk
-import gensim
-from nltk.stem.wordnet import WordNetLemmatizer
-from nltk.corpus import wordnet as wn
-from gensim.utils import simple_preprocess
+import string
+import threading
+from functools import cache, lru_cache
+from typing import Iterable
+
+import numpy
+from numpy._typing import NDArray
+
+from utils.latency import recorder, timed
+
+# NLTK resources used for preprocessing, by download name and location in nltk.data
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "stopwords": "corpora/stopwords",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+    "wordnet": "corpora/wordnet",
+    "omw-1.4": "corpora/omw-1.4",
+}
+_available_resources: set[str] = set()
+_resources_lock = threading.Lock()
+
+
+def require_nltk(*names: str) -> None:
+    """
+    Makes sure the given NLTK resources are installed. Resources are looked up
+    locally once per process and only downloaded when they are missing.
+    """
+    import nltk
+
+    for name in names:
+        if name in _available_resources:
+            continue
+
+        with _resources_lock:
+            try:
+                nltk.data.find(NLTK_RESOURCES[name])
+            except LookupError:
+                nltk.download(name, quiet=True)
+
+            _available_resources.add(name)
+
+
+class _NormalizeTable(dict):
+    """str.translate table, characters without an entry are mapped to a space"""
+
+    def __missing__(self, key: int) -> int:
+        self[key] = ord(" ")
+        return self[key]
+
+
+_NORMALIZE = _NormalizeTable(
+    {ord(c): ord(c.lower()) for c in string.ascii_letters}
+    | {ord(c): None for c in string.digits}
+)
+
+# Treebank contractions that can occur in normalized text, split after group 1
+_CONTRACTIONS = re.compile(
+    r"\b(can(?=not\b)|gim(?=me\b)|gon(?=na\b)|got(?=ta\b)|lem(?=me\b)|wan(?=na(?:\s|$)))"
+)
+
+# Same tokens as gensim.utils.simple_preprocess: runs of non-digit word characters
+_ALPHABETIC = re.compile(r"[^\W\d]+")
+
+EXTRA_STOPWORDS = (
+    "from",
+    "subject",
+    "re",
+    "edu",
+    "use",
+    "like",
+    "would",
+    "one",
+    "time",
+    "make",
+    "go",
+    "also",
+)
+
+
+@cache
+def _stop_words() -> frozenset[str]:
+    import nltk
+
+    require_nltk("stopwords")
+    return frozenset(nltk.corpus.stopwords.words("english")) | frozenset(
+        EXTRA_STOPWORDS
+    )
+
+
+# Model of a get_topic_matrix worker process
+_worker_model: "TopicModel | None" = None
+
+
+def _init_worker(path: str) -> None:
+    """Loads the model once in every process of a get_topic_matrix pool"""
+    global _worker_model
+    _worker_model = TopicModel.shared(path)
+    _worker_model.model
+
+
+def _infer_chunk(bags_of_words: list[list[tuple[int, int]]]) -> NDArray:
+    assert _worker_model is not None
+    return _worker_model.infer(bags_of_words)
+
+
+@cache
+def _lemmatizer():
+    from nltk.stem.wordnet import WordNetLemmatizer
+
+    require_nltk("wordnet", "omw-1.4")
+    return WordNetLemmatizer()
+
+
+@lru_cache(maxsize=65536)
+def lemmatize(word: str, tag: str) -> str:
+    """Lemmatizes a word given its Penn Treebank tag (memoized)"""
+    # WordNet POS by first letter of the Penn tag, anything else is a noun
+    pos = {"J": "a", "N": "n", "V": "v", "R": "r"}.get(tag[:1].upper(), "n")
+    return _lemmatizer().lemmatize(word, pos)
+
+
+@cache
+def load_phrasers(paths: tuple[str, ...]) -> tuple:
+    """
+    Loads the frozen phrase models (see tools/train_phraser.py) that exist at the
+    given paths, in order.
+    """
+    from gensim.models.phrases import FrozenPhrases
+
+    return tuple(FrozenPhrases.load(path) for path in paths if os.path.exists(path))
+
+
+def phrasers_from_tokens(tokens: Iterable[str], delimiter: str = "_") -> tuple:
+    """
+    Frozen phrase models that join exactly the given phrase tokens (e.g.
+    "high_school"), one model per extra word, so they are applied in order
+    """
+    from gensim.models.phrases import Phrases
+
+    # Phrases of n words, by n
+    phrases: dict[int, list[str]] = {}
+
+    for token in tokens:
+        words = token.split(delimiter)
+
+        if len(words) > 1 and all(len(word) != 0 for word in words):
+            phrases.setdefault(len(words), []).append(token)
+
+    phrasers = []
+
+    for n in range(2, max(phrases, default=1) + 1):
+        phraser = Phrases(delimiter=delimiter).freeze()
+        phraser.phrasegrams = {phrase: math.inf for phrase in phrases.get(n, [])}
+        phrasers.append(phraser)
+
+    return tuple(phrasers)
+
+
+@cache
+def _dictionary_phrasers(path: str) -> tuple:
+    """
+    Phrase models of the phrases in the dictionary of the model at path, which
+    were joined when the model was trained
+    """
+    try:
+        dictionary = TopicModel.shared(path).dictionary
+    except ValueError:
+        return ()
+
+    return phrasers_from_tokens(dictionary.token2id)
+
+
+class _FixedInitialGamma(numpy.random.RandomState):
+    """
+    Random state of an LDA model that starts the inference of every document from
+    the same gamma. Inference is then reproducible, and a document gets the same
+    topics whether it is inferred alone or in a batch. Every other draw (e.g. by
+    show_topics or update) is random as usual.
+    """
+
+    def __init__(self, num_topics: int, seed: int = 0) -> None:
+        super().__init__(seed)
+        self.num_topics = num_topics
+        self._gamma = numpy.random.RandomState(seed).gamma(100.0, 0.01, num_topics)
+
+    def gamma(self, shape, scale=1.0, size=None):
+        # LdaModel.inference draws the initial gamma of each document in the chunk
+        if isinstance(size, tuple) and len(size) == 2 and size[1] == self.num_topics:
+            return numpy.tile(self._gamma, (size[0], 1))
+
+        return super().gamma(shape, scale, size)
+
+
+def _pickled_class(path: str) -> str | None:
+    """
+    Qualified name of the class of the object pickled at path, read from the first
+    opcodes of the pickle without loading it. None if it is not a pickle.
+    """
+    strings: list[str] = []
+
+    try:
+        with open(path, "rb") as f:
+            for opcode, arg, _ in itertools.islice(pickletools.genops(f), 64):
+                if opcode.name == "GLOBAL":
+                    return arg.replace(" ", ".")
+
+                if opcode.name == "STACK_GLOBAL":
+                    return ".".join(strings[-2:]) if len(strings) >= 2 else None
+
+                if isinstance(arg, str):
+                    strings.append(arg)
+    except (OSError, ValueError):
+        return None
+
+    return None
+
+
+class TopicModelException(Exception):
+    """Exception that indicates a file could not be loaded as a topic model"""
+
+    def __init__(self, args):
+        super().__init__(*args)
 
 
 class TopicModel:
-    def __init__(self, path: str = "assets/topic_model/LDA_model_32") -> None:
-        # Downloads
-        nltk.download("punkt")
-        nltk.download("stopwords")
-        nltk.download("averaged_perceptron_tagger")
-        nltk.download("wordnet")
-        nltk.download("omw-1.4")
+    """
+    Wrapper around a gensim LDA model, either pickled or in gensim's own format
+    (see tools/convert_lda.py). The model is only loaded the first time it is
+    used, use TopicModel.shared() to load each model once per process.
+    """
+
+    DEFAULT_PATH = "assets/topic_model/LDA_model_32"
+    # Bigram and trigram models, applied in this order
+    PHRASER_PATHS = (
+        "assets/topic_model/phraser_bigram",
+        "assets/topic_model/phraser_trigram",
+    )
+
+    # Classes of the pickled gensim models that can be served
+    MODEL_CLASSES = frozenset(
+        {"gensim.models.ldamodel.LdaModel", "gensim.models.ldamulticore.LdaMulticore"}
+    )
+
+    # Latency stage of inference, followed by the file name of the model
+    LATENCY_STAGE = "lda.infer"
+
+    _shared: dict[str, "TopicModel"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: str = DEFAULT_PATH) -> None:
+        self.path = path
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._token2id: dict[str, int] | None = None
+        self._latency_stage = f"{self.LATENCY_STAGE}.{os.path.basename(path)}"
+
+    @classmethod
+    def shared(cls, path: str = DEFAULT_PATH) -> "TopicModel":
+        """Returns the process-wide (lazily loaded) instance of the model at path"""
+        key = os.path.abspath(path)
+
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(path)
 
-        self.model = self._load_model(path)
-        # print(self.model)
+            return cls._shared[key]
+
+    @staticmethod
+    def is_model_file(path: str) -> bool:
+        """
+        Whether the file at path holds an LDA model (rather than e.g. pickled
+        visualisation data), checked without loading it
+        """
+        return _pickled_class(path) in TopicModel.MODEL_CLASSES
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        """The gensim model, loaded on first access"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    model = self._load_model(self.path)
+                    model.random_state = _FixedInitialGamma(model.num_topics)
+                    self._model = model
+
+        return self._model
 
     def _load_model(self, path: str):
-        with open(path, "rb") as f:
-            model = pickle.load(f)
+        """
+        Models saved in gensim's format are loaded with their arrays memory-mapped
+        read-only, so processes using the same model share one copy
+        """
+        try:
+            if os.path.exists(path + ".expElogbeta.npy"):
+                from gensim.models import LdaModel
+
+                model = LdaModel.load(path, mmap="r")
+            else:
+                with open(path, "rb") as f:
+                    model = pickle.load(f)
+        except (pickle.UnpicklingError, ImportError, AttributeError, EOFError) as e:
+            raise TopicModelException([f"Cannot load {path}: {e}"]) from e
+
+        if not hasattr(model, "inference") or not hasattr(model, "expElogbeta"):
+            raise TopicModelException(
+                [f"{path} is not an LDA model but a {type(model).__name__}"]
+            )
 
         return model
 
+    @property
+    def num_topics(self) -> int:
+        return self.model.num_topics
+
+    @property
+    def dictionary(self):
+        """
+        The gensim Dictionary the model was trained with. A dictionary saved as
+        <model path>.dictionary takes precedence over the one in the model.
+        """
+        path = self.path + ".dictionary"
+
+        if os.path.exists(path):
+            from gensim.corpora import Dictionary
+
+            return Dictionary.load(path)
+
+        if self.model.id2word is None:
+            raise ValueError(f"No dictionary found for the topic model {self.path}")
+
+        return self.model.id2word
+
+    @property
+    def token2id(self) -> dict[str, int]:
+        """Token -> id map of the training dictionary, built once"""
+        if self._token2id is None:
+            self._token2id = dict(self.dictionary.token2id)
+
+        return self._token2id
+
+    def get_topic_vector(self, tokens: list[str] | list[tuple[str, str]]) -> NDArray:
+        """Returns the (dense) topic distribution as an array indexed by topic"""
+        return self.infer([self._bag_of_words(tokens)])[0]
+
+    def get_topic_matrix(
+        self,
+        docs: Iterable[list[str] | list[tuple[str, str]]],
+        chunk_size: int = 2000,
+        processes: int | None = None,
+    ) -> NDArray:
+        """
+        Returns the dense topic distributions of many documents as an
+        (n_docs, n_topics) array. Documents are inferred chunk_size at a time,
+        spread over a pool of worker processes when processes > 1.
+        """
+        bags_of_words = [self._bag_of_words(tokens) for tokens in docs]
+        chunks = [
+            bags_of_words[start : start + chunk_size]
+            for start in range(0, len(bags_of_words), chunk_size)
+        ]
+
+        if len(chunks) == 0:
+            return numpy.empty((0, self.num_topics), dtype=numpy.float32)
+
+        if processes is None or processes <= 1 or len(chunks) == 1:
+            return numpy.concatenate([self.infer(chunk) for chunk in chunks])
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            processes, initializer=_init_worker, initargs=(self.path,)
+        ) as pool:
+            return numpy.concatenate(list(pool.map(_infer_chunk, chunks)))
+
     def get_topic_probability(
         self, tokens: list[str] | list[tuple[str, str]]
     ) -> dict[int, float]:
         """Returns a dictionary of topic probabilities indexed by their topic"""
-
-        try:
-            if isinstance(tokens[0], tuple):
-                tokens = TopicModel.filter_tokens([token[0] for token in tokens])
-        except IndexError:
-            pass
-
-        bag_of_words = common_dictionary.doc2bow(tokens)
+        bag_of_words = self._bag_of_words(tokens)
         topics_prob_list: list[tuple[int, float]] = self.model.get_document_topics(
             bag_of_words
         )
         return dict(topics_prob_list)
 
+    def _bag_of_words(
+        self, tokens: list[str] | list[tuple[str, str]]
+    ) -> list[tuple[int, int]]:
+        """Tagged tokens are preprocessed first, plain tokens are used as is"""
+        if len(tokens) != 0 and isinstance(tokens[0], tuple):
+            tokens = TopicModel.filter_tokens(tokens)
+
+        token2id = self.token2id
+        counts: dict[int, int] = {}
+
+        for token in tokens:
+            _id = token2id.get(token)
+
+            if _id is not None:
+                counts[_id] = counts.get(_id, 0) + 1
+
+        return list(counts.items())
+
+    def infer(self, bags_of_words: list[list[tuple[int, int]]]) -> NDArray:
+        """
+        Batched variational inference, normalized like get_document_topics. Its
+        latency is recorded per model, as "lda.infer.<file name>".
+        """
+        model = self.model
+
+        with recorder.measure(self._latency_stage):
+            gamma, _ = model.inference(bags_of_words)
+
+        gamma = gamma.astype(numpy.float32)
+        return gamma / gamma.sum(axis=1, keepdims=True)
+
+    def get_topic(self, tokens: list[str] | list[tuple[str, str]]) -> int | None:
+        """Returns the most likely topic, None if none of the words are known"""
+        bag_of_words = self._bag_of_words(tokens)
+
+        if len(bag_of_words) == 0:
+            return None
+
+        return int(self.infer([bag_of_words])[0].argmax())
+
+    def get_topics(
+        self, docs: list[list[str]] | list[list[tuple[str, str]]]
+    ) -> list[int | None]:
+        """get_topic for many documents, inferred in a single batch"""
+        bags_of_words = [self._bag_of_words(tokens) for tokens in docs]
+        known = [
+            i for i, bag_of_words in enumerate(bags_of_words) if len(bag_of_words) != 0
+        ]
+        topics: list[int | None] = [None] * len(docs)
+
+        if len(known) != 0:
+            vectors = self.infer([bags_of_words[i] for i in known])
+
+            for i, topic in zip(known, vectors.argmax(axis=1).tolist()):
+                topics[i] = topic
+
+        return topics
+
     def get_topic_most_likely(
         self, tokens: list[str] | list[tuple[str, str]]
     ) -> tuple[int, float]:
@@ -56,95 +462,155 @@ class TopicModel:
     def is_on_topic(
         self,
         tokens_a: list[str] | list[tuple[str, str]],
-        tokens_b: list[str] | list[tuple[str, str]],
+        tokens_b: list[str] | list[tuple[str, str]] | NDArray,
         threshold: float = 0.8,
     ) -> bool:
         """
         Returns a bool based on if the likelihood of tokens_b having a smilar
-        probability for the highest topic of a
+        probability for the highest topic of a. tokens_b can also be given as a
+        precomputed topic vector (see get_topic_vector), then only tokens_a is
+        inferred.
         """
-        topic_a = self.get_topic_most_likely(tokens_a)
-        topic_b_probabilities = self.get_topic_probability(tokens_b)
-        # print(topic_a)
-        # print(topic_b_probabilities)
+        if isinstance(tokens_b, numpy.ndarray):
+            vector_a = self.get_topic_vector(tokens_a)
+            vector_b = tokens_b
+        else:
+            vector_a, vector_b = self.infer(
+                [self._bag_of_words(tokens_a), self._bag_of_words(tokens_b)]
+            )
 
-        return topic_b_probabilities[topic_a[0]] / topic_a[1] > threshold
+        topic_a = vector_a.argmax()
+        return vector_b[topic_a] / vector_a[topic_a] > threshold
 
     @staticmethod
-    def _remove_puctuation(document: str):
-        return re.sub(r"[^a-zA-Z0-9]", " ", document)
+    def _normalize(document: str) -> str:
+        """Lower-cases ASCII letters, drops digits and replaces anything else by a space"""
+        return document.translate(_NORMALIZE)
 
     @staticmethod
-    def _to_lower_case(document: str):
-        return document.lower()
+    def _tokenize(document: str) -> list[str]:
+        """
+        Splits normalized text like nltk.word_tokenize does. Normalized text only
+        holds lower-case letters and spaces, so the only Treebank rules that apply
+        are the contractions (cannot -> can not, gonna -> gon na, ...).
+        """
+        return _CONTRACTIONS.sub(r"\1 ", document).split()
 
     @staticmethod
-    def _remove_numbers(document: str):
-        return "".join([i for i in document if not i.isdigit()])
+    @timed("nlp.stopwords")
+    def _remove_stopwords(
+        document: str | list[str] | list[tuple[str, str]]
+    ) -> list[str] | list[tuple[str, str]]:
+        """
+        Keeps the words gensim's simple_preprocess would (alphabetic, 2 to 15
+        characters, not starting with "_") that are not stopwords. Tagged tokens
+        stay tagged, a token split into several words keeps its tag on each.
+        """
+        stop_words = _stop_words()
 
-    @staticmethod
-    def _tokenize(document: str):
-        return nltk.word_tokenize(document)
+        def keep(word: str) -> bool:
+            return 2 <= len(word) <= 15 and word[0] != "_" and word not in stop_words
 
-    @staticmethod
-    def _remove_stopwords(document: list[str]):
-        stop_words = nltk.corpus.stopwords.words("english")
-        stop_words.extend(
-            [
-                "from",
-                "subject",
-                "re",
-                "edu",
-                "use",
-                "like",
-                "would",
-                "one",
-                "time",
-                "make",
-                "go",
-                "also",
+        if len(document) != 0 and isinstance(document[0], tuple):
+            return [
+                (word, tag)
+                for token, tag in document
+                for word in _ALPHABETIC.findall(token.lower())
+                if keep(word)
             ]
-        )
 
-        return [
-            word for word in simple_preprocess(str(document)) if word not in stop_words
-        ]
+        if not isinstance(document, str):
+            document = " ".join(document)
+
+        return [word for word in _ALPHABETIC.findall(document.lower()) if keep(word)]
 
     @staticmethod
-    def _make_biagrams(document: list[str]):
-        bigram = gensim.models.Phrases(document, min_count=5, threshold=100)
-        bigram_mod = gensim.models.phrases.Phraser(bigram)
-        return bigram_mod[document]
+    @timed("nlp.phrases")
+    def _make_biagrams(
+        document: list[str] | list[tuple[str, str]]
+    ) -> list[str] | list[tuple[str, str]]:
+        """
+        Joins known phrases, e.g. ["public", "transport"] -> ["public_transport"].
+        A joined phrase of tagged tokens takes the tag of its last word.
+        """
+        if len(document) == 0:
+            return document
+
+        phrasers = load_phrasers(TopicModel.PHRASER_PATHS)
+
+        # Without trained phrase models, the phrases of the default model are used
+        if len(phrasers) == 0:
+            phrasers = _dictionary_phrasers(TopicModel.DEFAULT_PATH)
+
+        if len(phrasers) == 0:
+            return document
+
+        tagged = isinstance(document[0], tuple)
+        words = [token[0] for token in document] if tagged else document
+
+        for phraser in phrasers:
+            words = phraser[words]
+
+        if not tagged:
+            return words
+
+        # Realign the tags, a phrase covers the tokens it was joined from
+        tokens = []
+        i = 0
+
+        for word in words:
+            end = i + 1
+            joined = document[i][0]
+
+            while joined != word:
+                joined += "_" + document[end][0]
+                end += 1
+
+            tokens.append((word, document[end - 1][1]))
+            i = end
+
+        return tokens
 
     @staticmethod
-    def _lemmatization(document: list[str]):
-        def get_wordnet_pos(word):
-            """Map POS tag to first character lemmatize() accepts"""
-            tag = nltk.pos_tag([word])[0][1][0].upper()
-            tag_dict = {"J": wn.ADJ, "N": wn.NOUN, "V": wn.VERB, "R": wn.ADV}
+    @timed("nlp.lemmatization")
+    def _lemmatization(document: list[str] | list[tuple[str, str]]) -> list[str]:
+        """Lemmatizes a document, untagged documents are tagged first"""
+        return [lemmatize(word, tag) for word, tag in TopicModel.pos_tag(document)]
 
-            return tag_dict.get(tag, wn.NOUN)
+    @staticmethod
+    @timed("nlp.pos_tag")
+    def pos_tag(tokens: list[str] | list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """Tags all tokens with one tagger call, tagged tokens are returned as is"""
+        if len(tokens) == 0 or isinstance(tokens[0], tuple):
+            return tokens
 
-        texts_out = []
+        import nltk
 
-        lemma_function = WordNetLemmatizer()
-        for token in document:
-            lemma = lemma_function.lemmatize(token, get_wordnet_pos(token))
-            texts_out.append(lemma)
+        require_nltk("averaged_perceptron_tagger")
+        return nltk.pos_tag(tokens)
 
-        return texts_out
+    @staticmethod
+    @timed("nlp.pos_tag")
+    def pos_tag_sents(docs: list[list[str]]) -> list[list[tuple[str, str]]]:
+        """Tags many documents with one tagger, the same tags as pos_tag gives"""
+        import nltk
+
+        require_nltk("averaged_perceptron_tagger")
+        return nltk.pos_tag_sents(docs)
 
     @staticmethod
     def cleanup_and_tokenize(text: str) -> list[str]:
-        text = TopicModel._remove_puctuation(text)
-        text = TopicModel._to_lower_case(text)
-        text = TopicModel._remove_numbers(text)
-        return TopicModel._tokenize(text)
+        return TopicModel._tokenize(TopicModel._normalize(text))
 
     @staticmethod
-    def filter_tokens(tokens: list[str]) -> list[str]:
+    def filter_tokens(tokens: list[str] | list[tuple[str, str]]) -> list[str]:
+        """
+        Returns the lemmatized keywords. Untagged tokens are tagged in one pass
+        before stopwords are removed, tagged tokens are not tagged again.
+        """
+        tokens = TopicModel.pos_tag(tokens)
         tokens = TopicModel._remove_stopwords(tokens)
-        tokens = TopicModel._make_biagrams(tokens)  # TODO Check type?
+        tokens = TopicModel._make_biagrams(tokens)
         tokens = TopicModel._lemmatization(tokens)
         return tokens
 
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import os
+import threading
+
+from utils.latency import recorder
+from utils.topic_model import TopicModel, TopicModelException
+
+
+class TopicModelManager:
+    """
+    The topic models shipped in a directory, by file name. One of them is the
+    active model, which can be swapped while the agent is running. Models are
+    shared per process (see TopicModel.shared) and only loaded when used.
+    """
+
+    DEFAULT_DIRECTORY = "assets/topic_model"
+    DEFAULT_MODEL = "LDA_model_32"
+
+    def __init__(
+        self, directory: str = DEFAULT_DIRECTORY, active: str = DEFAULT_MODEL
+    ) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._active = self.get(active)
+        self._active_name = active
+
+    @property
+    def active(self) -> TopicModel:
+        return self._active
+
+    @property
+    def active_name(self) -> str:
+        return self._active_name
+
+    def available(self) -> list[str]:
+        """
+        Names of the models in the directory that can be activated. Files
+        generated next to the models (visualisations, tables, phrase models,
+        arrays) and pickles that are not LDA models are skipped.
+        """
+        return sorted(
+            name
+            for name in os.listdir(self.directory)
+            if "." not in name
+            and not name.startswith("phraser_")
+            and os.path.isfile(os.path.join(self.directory, name))
+            and TopicModel.is_model_file(os.path.join(self.directory, name))
+        )
+
+    def get(self, name: str) -> TopicModel:
+        """Returns the (not necessarily loaded) model with the given name"""
+        path = os.path.join(self.directory, name)
+
+        if not os.path.isfile(path):
+            raise TopicModelException(
+                [f"No topic model named {name} in {self.directory}"]
+            )
+
+        return TopicModel.shared(path)
+
+    def activate(self, name: str) -> TopicModel:
+        """
+        Loads the model with the given name and makes it the active model. The
+        model is loaded before it is swapped in, so a model that fails to load
+        leaves the active model in place.
+        """
+        model = self.get(name)
+        model.model
+
+        with self._lock:
+            self._active = model
+            self._active_name = name
+
+        return model
+
+    def latency(self) -> dict[str, dict[str, float]]:
+        """
+        Inference latency (see LatencyRecorder.stats) of every model in the
+        directory that was used while latency recording was on, by name
+        """
+        prefix = TopicModel.LATENCY_STAGE + "."
+        names = set(self.available())
+
+        return {
+            stage[len(prefix) :]: stats
+            for stage, stats in recorder.stats().items()
+            if stage.startswith(prefix) and stage[len(prefix) :] in names
+        }
@@ -1,5 +1,16 @@
+import threading
+
+import pytest
 from spacy.tokens.doc import Doc
-from memory.processing.pipeline import Pipeline, PosPipe
+
+from memory.processing.pipeline import (
+    FluencyPipe,
+    KeywordPipe,
+    Pipe,
+    Pipeline,
+    PosPipe,
+    TopicPipe,
+)
 
 
 class TestPosPipe:
@@ -13,3 +24,91 @@ class TestPosPipe:
         pipeline = Pipeline()
         tokens, metadata = pipeline.process("This is some text, and, again, some text")
         assert metadata.fluency_score != 9 and metadata.fluency_score != 0
+
+
+class UpperPipe(Pipe):
+    inputs = ("text",)
+    output = "upper"
+
+    def process(self, text):
+        return text.upper()
+
+
+class LengthPipe(Pipe):
+    inputs = ("upper",)
+    output = "length"
+
+    def process(self, upper):
+        return len(upper)
+
+
+class ThreadPipe(Pipe):
+    inputs = ("upper",)
+    output = "thread"
+
+    def process(self, upper):
+        return threading.current_thread().name
+
+
+class JoinPipe(Pipe):
+    inputs = ("length", "thread")
+    output = "joined"
+
+    def process(self, length, thread):
+        return f"{length}:{thread}"
+
+
+class TestPipeline:
+    def test_default_stages(self):
+        stages = [[type(pipe) for pipe in stage] for stage in Pipeline().stages]
+        assert stages == [[PosPipe], [KeywordPipe], [TopicPipe, FluencyPipe]]
+
+    def test_run(self):
+        pipeline = Pipeline([JoinPipe(), LengthPipe(), ThreadPipe(), UpperPipe()])
+        assert [len(stage) for stage in pipeline.stages] == [1, 2, 1]
+
+        values = pipeline.run("text")
+
+        assert values["upper"] == "TEXT" and values["length"] == 4
+        assert values["thread"].startswith("pipeline")
+        assert values["joined"] == "4:" + values["thread"]
+
+    def test_run_known(self):
+        pipeline = Pipeline([JoinPipe(), LengthPipe(), ThreadPipe(), UpperPipe()])
+        values = pipeline.run("text", {"upper": "LONGER", "thread": "main"})
+
+        assert values["length"] == 6 and values["joined"] == "6:main"
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            Pipeline([LengthPipe()])
+
+        with pytest.raises(ValueError):
+            Pipeline([UpperPipe(), UpperPipe()])
+
+    def test_process_batch(self):
+        pipeline = Pipeline([UpperPipe(), LengthPipe()])
+        texts = ["some text", "", "more text here", "a", "b"]
+
+        for processes in (None, 2):
+            columns = (
+                pipeline.run_batch(texts)
+                if processes is None
+                else pipeline._run_batch_in_pool(texts, 2, processes)
+            )
+
+            assert columns == {
+                "upper": [text.upper() for text in texts],
+                "length": [len(text) for text in texts],
+            }
+
+    def test_process_batch_matches_process(self):
+        pipeline = Pipeline()
+        texts = ["I like to go hiking in the mountains", "", "Cooking dinner, and, um"]
+
+        for text, (tokens, metadata) in zip(texts, pipeline.process_batch(texts)):
+            expected_tokens, expected = pipeline.process(text)
+
+            assert tokens == expected_tokens
+            assert metadata.topic == expected.topic
+            assert metadata.fluency_score == expected.fluency_score
@@ -0,0 +1,125 @@
+from collections import Counter
+
+import numpy
+import pytest
+
+from memory.processing.fluency import FluencyFeatures, LanguageFluency
+from memory.processing.pipeline import Pipeline
+from memory.processing.stream import StreamingProcessor
+from memory.topictracker import TopicTracker
+from utils.topic_model import TopicModel
+
+
+class TestStreamingProcessor:
+    def _pre(self):
+        self.stream = StreamingProcessor(
+            Pipeline(), TopicTracker(TopicModel.shared(), max_tokens=None)
+        )
+
+    def test_feed(self):
+        self._pre()
+        fragments = ["I read a book ", "the book was a story ", "about a book "]
+        keywords = []
+        features = FluencyFeatures()
+
+        for timestamp, fragment in enumerate(fragments):
+            tokens, metadata = self.stream.feed(fragment, timestamp)
+            keywords += metadata.outputs["keywords"]
+            features.add(tokens, metadata.outputs["keywords"])
+
+            assert metadata.fluency_score == LanguageFluency().get_fluency(tokens)[0]
+
+        assert len(self.stream) == 3 and self.stream.features.pauses == 2
+        assert numpy.array_equal(
+            self.stream.features.vector()[:5], features.vector()[:5]
+        )
+        assert self.stream.topic == TopicModel.shared().get_topic(keywords)
+
+    def test_end(self):
+        self._pre()
+        self.stream.feed("book book book", 0)
+        self.stream.end(speech_time=1.5)
+
+        assert self.stream.features.speech_time == 1.5 and len(self.stream) == 1
+
+        # The next fragment starts a new turn, without a pause before it
+        self.stream.feed("book", 1)
+        assert self.stream.features.pauses == 0 and len(self.stream) == 1
+
+        self.stream.feed("story", 2)
+        assert self.stream.features.pauses == 1 and len(self.stream) == 2
+
+
+class TestFluencyFeatures:
+    def test_add(self):
+        features = FluencyFeatures()
+        features.add(
+            [("I", "PRP"), ("like", "VBP"), ("books", "NNS"), ("and", "CC")],
+            ["like", "book"],
+        )
+        features.add([("for", "IN"), ("example", "NN"), ("books", "NNS")], ["book"])
+        features.add_pause()
+        features.add_speech_time(3.5)
+
+        values = dict(zip(FluencyFeatures.FEATURES, features.vector().tolist()))
+
+        assert values["words"] == 7 and values["type_token_ratio"] == pytest.approx(
+            6 / 7
+        )
+        assert values["repetition_rate"] == pytest.approx(1 / 3)
+        assert values["max_repetitions"] == 2 and values["pauses"] == 1
+        assert values["connective_rate"] == pytest.approx(2 / 7)
+        assert values["words_per_second"] == 2.0
+
+    def test_merge(self):
+        fragments = [
+            ([("a", "DT"), ("book", "NN")], ["book"]),
+            ([("so", "RB"), ("book", "NN"), ("film", "NN")], ["book", "film"]),
+            ([("film", "NN")], ["film"]),
+        ]
+        whole, first, second = FluencyFeatures(), FluencyFeatures(), FluencyFeatures()
+
+        for tokens, keywords in fragments:
+            whole.add(tokens, keywords)
+
+        first.add(*fragments[0])
+        second.add(*fragments[1])
+        second.add(*fragments[2])
+        first.merge(second)
+
+        assert numpy.array_equal(first.vector(), whole.vector())
+
+
+class TestLanguageFluency:
+    def test_speech_fluency(self):
+        fluency = LanguageFluency()
+
+        def score(**values):
+            features = {name: 0.0 for name in FluencyFeatures.FEATURES}
+            features.update(values)
+            return fluency.get_speech_fluency(numpy.array(list(features.values())))[0]
+
+        fluent = {"words": 300, "type_token_ratio": 0.5, "connective_rate": 0.05}
+        fluent.update(words_per_second=2.5, speech_time=120, pauses=6)
+
+        assert score() == 0
+        assert score(**fluent) == 9
+        assert score(**{**fluent, "repetition_rate": 0.6}) == 6
+        assert score(**{**fluent, "words_per_second": 0.8}) == 7
+        assert score(**{**fluent, "repetition_rate": 0.9, "pauses": 60}) == 1
+
+    def test_score_most_repeated(self):
+        fluency = LanguageFluency()
+
+        for keywords in ([], ["a"], ["a", "a", "b"], ["a"] * 3, ["a"] * 5):
+            repetitions = Counter(keywords)
+            most_repeated = max(repetitions.values(), default=0)
+
+            assert fluency._calculate_fluency_score(
+                repetitions
+            ) == fluency._score_most_repeated(most_repeated)
+
+        scores = {0: 7, 1: 9, 2: 8, 4: 6, 8: 2, 10: 2}
+
+        for most_repeated, score in scores.items():
+            assert fluency._score_most_repeated(most_repeated) == score
@@ -0,0 +1,56 @@
+import os
+from memory.cuecardtopics import CueCardTopics
+from memory.questionbank import QuestionBank
+from utils.topic_model import TopicModel
+
+
+class TestCueCardTopics:
+    def _pre(self, tmp_path):
+        self.bank_path = os.path.join(tmp_path, "question_bank.csv")
+
+        with open(self.bank_path, "w") as f:
+            f.write("topic,questions\n")
+            f.write('"Describe a book you have recently read","Why?"\n')
+            f.write('"Describe a sport you enjoy playing","How often?"\n')
+
+        self.model = TopicModel()
+        self.table = CueCardTopics(
+            QuestionBank(self.bank_path),
+            self.model,
+            path=os.path.join(tmp_path, "cue_card_topics.npz"),
+        )
+
+    def test_lookup_matches_inference(self, tmp_path):
+        self._pre(tmp_path)
+
+        keywords, topic, _ = self.table.lookup(0)
+
+        assert keywords == TopicModel.preprocess(
+            "Describe a book you have recently read"
+        )
+        assert topic == self.model.get_topic_most_likely(keywords)[0]
+
+    def test_corrupt_table(self, tmp_path):
+        self._pre(tmp_path)
+        self.table.build()
+
+        # A table truncated by a process that crashed while writing it
+        with open(self.table.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.table.path) // 2)
+
+        table = CueCardTopics(self.table.question_bank, self.model, self.table.path)
+        assert len(table) == 2
+        assert sorted(os.listdir(tmp_path)) == [
+            "cue_card_topics.npz",
+            "question_bank.csv",
+        ]
+
+    def test_invalidated_on_change(self, tmp_path):
+        self._pre(tmp_path)
+
+        assert len(self.table) == 2
+
+        with open(self.bank_path, "a") as f:
+            f.write('"Describe a place you visited","Where?"\n')
+
+        assert len(self.table) == 3
@@ -3,7 +3,8 @@ import numpy
 from pymongo import database
 from spacy.tokens.doc import Doc
 from spacy.vocab import Vocab
-from memory.databasewrapper import Database, Session, User, Utterance
+from memory.databasewrapper import Database, MetaData, Session, User, Utterance
+from memory.faceindex import IVFFaceIndex
 
 
 class TestDatabase:
@@ -11,7 +12,7 @@ class TestDatabase:
         self.db: Database = Database("test_db", clear=True)
 
     def _post(self):
-        pass
+        self.db.close()
 
     def test_get_cue_card_random(self):
         self._pre()
@@ -74,3 +75,175 @@ class TestDatabase:
         assert utterance == found_utterance
 
         self._post()
+
+    def test_write_retried_after_partial_failure(self):
+        self._pre()
+
+        vocabulary = self.db.vocabulary
+        objs = [
+            Utterance([(word, "NN")], float(i), True)._to_mongo_obj(vocabulary)
+            for i, word in enumerate(["one", "two", "three"])
+        ]
+
+        # An earlier attempt that only wrote the first word and utterance
+        self.db.vocabulary_words.insert_one({"_id": 0, "word": "one"})
+        self.db.utterances.insert_one(objs[0])
+
+        self.db._write_utterances(objs)
+
+        assert self.db.utterances.count_documents({}) == 3
+        assert self.db.vocabulary_words.count_documents({}) == 3
+        assert vocabulary.take_pending() == []
+
+        self._post()
+
+    def test_vocabulary_with_gap(self):
+        self._pre()
+
+        # The write of word 1 failed and was never retried
+        self.db.vocabulary_words.insert_many(
+            [{"_id": 0, "word": "zero"}, {"_id": 2, "word": "two"}]
+        )
+        vocabulary = self.db._load_vocabulary()
+
+        assert vocabulary.words[2] == "two" and vocabulary.intern("new") == 3
+
+        self._post()
+
+    def test_progress_window(self):
+        self._pre()
+
+        user = User("user", numpy.array([]), _id=1)
+
+        for i in range(8):
+            session = Session(user, start_time=float(i), average_score=float(i % 3))
+            self.db._update_progress(session, topic=i)
+
+        progress = self.db.get_progress_by_user(user)
+        scores = [float(i % 3) for i in range(3, 8)]
+
+        assert len(progress) == self.db.progress_window
+        assert [entry["topic"] for entry in progress.entries] == list(range(3, 8))
+        assert numpy.isclose(
+            progress.slope("score"),
+            numpy.polyfit(scores, numpy.linspace(0, 5, 5), 1)[0],
+        )
+
+        self._post()
+
+    def test_user_without_face(self):
+        self._pre()
+
+        face = numpy.full(128, 0.1)
+        self.db._insert_user(User("no face", numpy.array([]), _id=1))
+        self.db._insert_user(User("face", face, _id=2))
+
+        assert self.db.user_from_encodings(face).name == "face"
+
+        self._post()
+
+    def test_face_index_restored(self, tmp_path, monkeypatch):
+        self.db = Database(
+            "test_db", clear=True, face_index=IVFFaceIndex(path=str(tmp_path))
+        )
+        face = numpy.full(128, 0.1)
+        self.db._insert_user(User("no face", numpy.array([]), _id=1))
+        self.db._insert_user(User("face", face, _id=2))
+
+        # A user without a face must not make the persisted index look outdated
+        def rebuild(*args):
+            raise AssertionError("The face index was rebuilt")
+
+        monkeypatch.setattr(IVFFaceIndex, "add_many", rebuild)
+        self.db.face_index = IVFFaceIndex(path=str(tmp_path))
+        self.db._build_face_index()
+
+        assert list(self.db.face_index.ids) == [2]
+        assert self.db.user_from_encodings(face).name == "face"
+
+        self._post()
+
+    def test_session_references_user(self):
+        self._pre()
+
+        user = User("user", numpy.array([0.5, 0.25]), _id=1)
+        self.db._insert_user(user)
+        self.db._insert_session(Session(user, start_time=20.0))
+        self.db._insert_session(Session(user, start_time=10.0))
+
+        stored = self.db.sessions.find_one()
+        sessions = self.db.get_sessions_by_user(user)
+
+        assert stored["user"] == {"_id": 1}
+        assert [session.start_time for session in sessions] == [10.0, 20.0]
+        assert all(session.user is user for session in sessions)
+        assert all(session.user == user for session in self.db._get_all_sessions())
+
+        self._post()
+
+    def test_session_fluency_features(self):
+        self._pre()
+
+        user = User("user", numpy.array([0.5, 0.25]), _id=1)
+        features = numpy.array([120, 0.5, 0.25, 3, 0.05, 2.0, 4, 60], numpy.float32)
+        self.db._insert_session(Session(user, start_time=10.0, average_score=6.0))
+        self.db._insert_session(
+            Session(
+                user,
+                start_time=20.0,
+                average_score=6.0,
+                fluency_features=features,
+                fluency_score=8.0,
+            )
+        )
+
+        old, new = self.db.get_sessions_by_user(user)
+
+        assert old.fluency_features is None and old.score == 6.0
+        assert numpy.array_equal(new.fluency_features, features) and new.score == 8.0
+
+        self._post()
+
+    def test_orphaned_session(self):
+        self._pre()
+
+        user = User("user", numpy.array([0.5, 0.25]), _id=1)
+        self.db._insert_user(user)
+        self.db._insert_session(Session(user, start_time=10.0))
+        self.db._insert_session(
+            Session(User("deleted", numpy.array([]), _id=2), start_time=20.0)
+        )
+
+        assert [session.user for session in self.db._get_all_sessions()] == [user]
+
+        self._post()
+
+    def test_last_utterance_is_newest(self):
+        self._pre()
+
+        for timestamp in [2.0, 3.0, 1.0]:
+            self.db.insert_utterance(Utterance([], timestamp, True))
+
+        assert self.db.get_last_utterance().timestamp == 3.0
+
+        self._post()
+
+    def test_flush_short_term_aggregates(self):
+        self._pre()
+
+        user = User("user", numpy.array([]), _id=1)
+        session = Session(user, cue_card_id=0)
+
+        for score, topic in [(9, 1), (7, 1), (2, 3)]:
+            self.db.insert_utterance(
+                Utterance([], time.time(), True, MetaData(topic, score))
+            )
+        self.db.insert_utterance(Utterance([], time.time(), True))
+
+        self.db.flush_short_term(session)
+
+        assert session.average_score == 6.0 and session.utterance_count == 4
+        assert session.topic_counts == {"1": 2, "3": 1}
+        assert self.db.get_last_utterance() is None
+
+        self._post()
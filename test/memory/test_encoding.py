@@ -0,0 +1,68 @@
+import pickle
+import numpy
+import pytest
+from memory.encoding import (
+    MISSING_WORD,
+    UNKNOWN_TAG,
+    LegacyFormatException,
+    Vocabulary,
+    decode_face_encodings,
+    decode_tokens,
+    encode_face_encodings,
+    encode_tokens,
+)
+
+
+class TestEncoding:
+    tokens = [("this", "DT"), ("is", "VBZ"), ("a", "DT"), ("test", "NN"), (".", ".")]
+
+    def test_tokens_inline(self):
+        obj = encode_tokens(self.tokens)
+
+        assert decode_tokens(obj) == self.tokens
+
+    def test_tokens_vocabulary(self):
+        vocabulary = Vocabulary()
+        first = encode_tokens(self.tokens, vocabulary)
+        second = encode_tokens(self.tokens[::-1], vocabulary)
+
+        assert len(vocabulary) == 5 and "words" not in first
+        assert decode_tokens(first, Vocabulary(vocabulary.words)) == self.tokens
+        assert decode_tokens(second, vocabulary) == self.tokens[::-1]
+
+    def test_pending_words(self):
+        vocabulary = Vocabulary(["known"])
+        for word in ("one", "two", "three"):
+            vocabulary.intern(word)
+
+        pending = vocabulary.take_pending()
+        assert pending == [(1, "one"), (2, "two"), (3, "three")]
+
+        vocabulary.intern("four")
+        vocabulary.return_pending([pending[1]])
+        assert vocabulary.take_pending() == [(2, "two"), (4, "four")]
+        assert vocabulary.take_pending() == []
+
+    def test_vocabulary_from_pairs(self):
+        vocabulary = Vocabulary.from_pairs([(3, "three"), (0, "zero"), (1, "one")])
+
+        assert vocabulary.words == ["zero", "one", MISSING_WORD, "three"]
+        assert vocabulary.intern("three") == 3
+        assert vocabulary.intern(MISSING_WORD) == 4
+        assert len(Vocabulary.from_pairs([])) == 0
+
+    def test_unknown_tag(self):
+        obj = encode_tokens([("word", "NOT_A_TAG"), ("-", "--")])
+
+        assert decode_tokens(obj) == [("word", UNKNOWN_TAG), ("-", "--")]
+
+    def test_face_encodings(self):
+        encodings = numpy.random.default_rng(0).normal(size=128)
+        decoded = decode_face_encodings(encode_face_encodings(encodings))
+
+        assert decoded.dtype == numpy.float32 and not decoded.flags.writeable
+        assert numpy.allclose(decoded, encodings, atol=1e-6)
+
+    def test_legacy(self):
+        with pytest.raises(LegacyFormatException):
+            decode_face_encodings(pickle.dumps(numpy.zeros(128)))
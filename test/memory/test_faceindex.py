@@ -0,0 +1,81 @@
+import numpy
+from memory.faceindex import FaceIndex, IVFFaceIndex
+
+
+class TestFaceIndex:
+    def _pre(self):
+        self.rng = numpy.random.default_rng(0)
+        self.encodings = self.rng.normal(0, 0.1, (100, 128))
+        self.index = FaceIndex()
+        self.index.add_many(list(range(100)), list(self.encodings))
+
+    def test_nearest_matches_brute_force(self):
+        self._pre()
+
+        query = self.encodings[42] + self.rng.normal(0, 0.01, 128)
+        _id, distance = self.index.nearest(query, tolerance=10.0)
+        expected = numpy.linalg.norm(self.encodings - query, axis=1)
+
+        assert _id == 42 and abs(distance - expected.min()) < 1e-4
+
+    def test_tolerance(self):
+        self._pre()
+
+        assert self.index.nearest(self.encodings[0] + 10.0) is None
+
+    def test_remove(self):
+        self._pre()
+
+        self.index.remove(42)
+
+        assert len(self.index) == 99 and 42 not in self.index
+        assert self.index.nearest(self.encodings[42], tolerance=1e-3) is None
+        assert self.index.nearest(self.encodings[99], tolerance=1e-3)[0] == 99
+
+    def test_mismatching_dimensions(self):
+        self._pre()
+
+        assert not self.index.add(100, numpy.zeros(3))
+        assert self.index.nearest(numpy.zeros(3)) is None
+
+    def test_empty_encoding(self):
+        index = FaceIndex()
+
+        assert not index.add(0, numpy.array([]))
+        assert index.dimensions is None and len(index) == 0
+        assert index.add(1, numpy.zeros(128)) and index.dimensions == 128
+
+
+class TestIVFFaceIndex:
+    def _pre(self, path=None):
+        self.rng = numpy.random.default_rng(0)
+        self.encodings = self.rng.normal(0, 0.1, (2000, 128))
+        self.index = IVFFaceIndex(path=path, n_lists=16, n_probe=4, train_size=1000)
+        self.index.add_many(list(range(1000)), list(self.encodings[:1000]))
+
+        for _id in range(1000, 2000):
+            self.index.add(_id, self.encodings[_id])
+
+    def test_trained_lookup(self):
+        self._pre()
+
+        assert self.index.trained and len(self.index) == 2000
+
+        for _id in [0, 999, 1000, 1999]:
+            assert self.index.nearest(self.encodings[_id], tolerance=1e-3)[0] == _id
+
+    def test_remove(self):
+        self._pre()
+
+        self.index.remove(0)
+
+        assert self.index.nearest(self.encodings[0], tolerance=1e-3) is None
+        assert self.index.nearest(self.encodings[1999], tolerance=1e-3)[0] == 1999
+
+    def test_restore(self, tmp_path):
+        self._pre(str(tmp_path))
+
+        restored = IVFFaceIndex(path=str(tmp_path), n_lists=16, n_probe=4)
+
+        assert restored.restore() and len(restored) == 2000
+        assert restored.nearest(self.encodings[1500], tolerance=1e-3)[0] == 1500
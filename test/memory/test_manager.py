@@ -1,6 +1,8 @@
 import numpy
 from memory.databasewrapper import User
 from memory.memorymanager import MemoryManager
+from memory.processing.pipeline import TopicPipe
+from utils.topic_model import TopicModel
 
 
 class TestManager:
@@ -12,6 +14,7 @@ class TestManager:
     def _post(self):
         self.manager.db.sessions.drop()
         self.manager.db.users.drop()
+        self.manager.close()
 
     def test_cue_card(self):
         self._pre()
@@ -52,6 +55,25 @@ class TestManager:
 
         self._post()
 
+    def test_topic_model_per_instance(self):
+        self._pre()
+        other = MemoryManager(database_name="test_db")
+        model = TopicModel()
+
+        self.manager.processing.set_topic_model(model)
+        topic_models = [
+            pipe.model
+            for manager in (self.manager, other)
+            for pipe in manager.processing.pipes
+            if isinstance(pipe, TopicPipe)
+        ]
+
+        assert topic_models == [model, other.topic_model]
+        assert self.manager.speech.pipeline is self.manager.processing
+
+        other.close()
+        self._post()
+
     def test_submit_utterance(self):
         self._pre()
 
@@ -0,0 +1,40 @@
+import os
+from memory.questionbank import QuestionBank
+
+
+class TestQuestionBank:
+    def _pre(self, tmp_path):
+        self.path = os.path.join(tmp_path, "question_bank.csv")
+        self._write(
+            [("Describe a book", "Why?|Who wrote it?"), ("Describe a place", "Where?")]
+        )
+        self.bank = QuestionBank(self.path)
+
+    def _write(self, rows):
+        with open(self.path, "w") as f:
+            f.write("topic,questions\n")
+            for topic, questions in rows:
+                f.write(f'"{topic}","{questions}"\n')
+
+    def test_random(self, tmp_path):
+        self._pre(tmp_path)
+
+        card, _id = self.bank.random()
+
+        assert card == self.bank.cue_card(_id)
+
+    def test_follow_ups(self, tmp_path):
+        self._pre(tmp_path)
+
+        assert self.bank.follow_ups(0) == ["Why?", "Who wrote it?"]
+        assert self.bank.follow_ups(1) == ["Where?"]
+
+    def test_reload(self, tmp_path):
+        self._pre(tmp_path)
+
+        assert len(self.bank) == 2
+
+        self._write([("Describe a sport", "How often?")])
+        os.utime(self.path, ns=(0, 0))
+
+        assert len(self.bank) == 1 and self.bank.cue_card(0) == "Describe a sport"
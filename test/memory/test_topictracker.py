@@ -0,0 +1,43 @@
+import numpy
+
+from memory.topictracker import TopicTracker
+from utils.topic_model import TopicModel
+
+
+class TestTopicTracker:
+    def _pre(self, max_tokens=None, max_seconds=None):
+        self.model = TopicModel.shared()
+        self.tracker = TopicTracker(self.model, max_tokens, max_seconds)
+
+    def test_empty(self):
+        self._pre()
+
+        assert self.tracker.distribution is None and self.tracker.topic is None
+        assert self.tracker.on_topic_probability(numpy.zeros(32)) == 1.0
+
+    def test_window_by_tokens(self):
+        self._pre(max_tokens=4)
+
+        self.tracker.add(["book", "story", "qwzx"], 0)
+        assert len(self.tracker) == 2
+
+        self.tracker.add(["football", "team", "match"], 1)
+        assert len(self.tracker) == 3
+
+        distribution = self.tracker.distribution
+        expected = self.model.get_topic_vector(["football", "team", "match"])
+        assert numpy.allclose(distribution, expected, atol=0.05)
+        assert self.tracker.topic == distribution.argmax()
+
+    def test_window_by_seconds(self):
+        self._pre(max_seconds=10)
+
+        self.tracker.add(["book", "story"], 0)
+        self.tracker.add(["novel"], 5)
+        assert len(self.tracker) == 3
+
+        self.tracker.add(["football"], 12)
+        assert len(self.tracker) == 2
+
+        self.tracker.clear()
+        assert len(self.tracker) == 0 and self.tracker.distribution is None
@@ -0,0 +1,87 @@
+import time
+import pytest
+
+from memory.writebehind import PartialWriteException, WriteBehindQueue
+
+
+class TestWriteBehindQueue:
+    def _pre(self, batch_size=3, max_latency=60.0):
+        self.batches = []
+        self.queue = WriteBehindQueue(
+            self.batches.append, batch_size=batch_size, max_latency=max_latency
+        )
+
+    def _post(self):
+        self.queue.close()
+
+    def test_flush(self):
+        self._pre()
+
+        self.queue.put({"i": 0})
+        self.queue.put({"i": 1})
+        assert self.queue.depth == 2
+
+        self.queue.flush()
+        assert self.batches == [[{"i": 0}, {"i": 1}]] and self.queue.depth == 0
+
+        self._post()
+
+    def test_batch_size(self):
+        self._pre()
+
+        for i in range(3):
+            self.queue.put({"i": i})
+
+        deadline = time.time() + 5
+        while len(self.batches) == 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+        assert self.batches == [[{"i": 0}, {"i": 1}, {"i": 2}]]
+        assert self.queue.metrics()["written"] == 3
+
+        self._post()
+
+    def test_max_latency(self):
+        self._pre(batch_size=100, max_latency=0.05)
+
+        self.queue.put({"i": 0})
+
+        deadline = time.time() + 5
+        while len(self.batches) == 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+        assert self.batches == [[{"i": 0}]]
+
+        self._post()
+
+    def test_partial_failure(self):
+        self._pre()
+        writes = []
+
+        def write(batch):
+            writes.append(batch)
+
+            if len(writes) == 1:
+                raise PartialWriteException(["failed"], batch[1:2])
+
+        self.queue._write = write
+
+        for i in range(2):
+            self.queue.put({"i": i})
+
+        with pytest.raises(PartialWriteException):
+            self.queue.flush()
+
+        assert self.queue.depth == 1 and self.queue.metrics()["written"] == 1
+
+        self.queue.flush()
+        assert writes[1] == [{"i": 1}] and self.queue.metrics()["written"] == 2
+
+        self._post()
+
+    def test_close(self):
+        self._pre()
+        self.queue.put({"i": 0})
+        self.queue.close()
+
+        assert self.batches == [[{"i": 0}]] and not self.queue._thread.is_alive()
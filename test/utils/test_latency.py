@@ -0,0 +1,87 @@
+import logging
+import time
+
+import pytest
+
+from utils.latency import LatencyHistogram, LatencyRecorder, recorder, timed
+
+
+class TestLatencyHistogram:
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+
+        for i in range(1, 1001):
+            histogram.record(i / 1000)  # 1ms to 1s
+
+        stats = histogram.stats()
+
+        assert stats["count"] == 1000 and stats["max"] == pytest.approx(1000)
+        assert stats["mean"] == pytest.approx(500.5)
+
+        for name, expected in (("p50", 500), ("p95", 950), ("p99", 990)):
+            assert expected <= stats[name] <= expected * 1.19
+
+    def test_empty(self):
+        assert LatencyHistogram().stats() == {"count": 0}
+
+
+class TestLatencyRecorder:
+    def _pre(self):
+        self.recorder = LatencyRecorder()
+
+    def test_disabled(self):
+        self._pre()
+
+        with self.recorder.measure("stage"):
+            pass
+
+        assert self.recorder.stats() == {} and self.recorder.summary() == ""
+
+    def test_measure(self):
+        self._pre()
+        self.recorder.enable()
+
+        for _ in range(3):
+            with self.recorder.measure("stage"):
+                pass
+
+        assert self.recorder.stats()["stage"]["count"] == 3
+        assert self.recorder.summary().startswith("stage ")
+
+        self.recorder.reset()
+        assert self.recorder.stats() == {}
+
+    def test_timed(self):
+        @timed("test.function")
+        def function(value):
+            return value * 2
+
+        assert function(2) == 4
+        assert "test.function" not in recorder.stats()
+
+        recorder.enable()
+
+        try:
+            assert function(3) == 6
+            assert recorder.stats()["test.function"]["count"] == 1
+        finally:
+            recorder.disable()
+            recorder.reset()
+
+    def test_logging(self, caplog):
+        self._pre()
+        self.recorder.enable()
+
+        with self.recorder.measure("stage"):
+            pass
+
+        with caplog.at_level(logging.INFO, logger="utils.latency"):
+            self.recorder.start_logging(0.05)
+            deadline = time.time() + 5
+
+            while len(caplog.records) == 0 and time.time() < deadline:
+                time.sleep(0.01)
+
+            self.recorder.stop_logging()
+
+        assert "stage" in caplog.records[0].getMessage()
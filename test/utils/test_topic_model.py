@@ -1,7 +1,127 @@
-from utils.topic_model import TopicModel
+import numpy
+from gensim.models.phrases import Phrases
+
+from utils.latency import recorder
+from utils.topic_model import TopicModel, load_phrasers, phrasers_from_tokens
 
 
 class TestTopicModel:
     def test_simple(self):
         model = TopicModel()
         assert model.is_on_topic(["one", "topic"], ["one", "topic"])
+
+    def test_precomputed_vector(self):
+        model = TopicModel.shared()
+        vector = model.get_topic_vector(["football", "team", "match"])
+
+        assert model.is_on_topic(["football", "match", "team"], vector)
+        assert not model.is_on_topic(["book", "novel", "story"], vector)
+
+    def test_shared_is_lazy(self):
+        model = TopicModel("assets/topic_model/LDA_model_32")
+        assert model._model is None
+
+        model = TopicModel.shared()
+        assert model is TopicModel.shared(TopicModel.DEFAULT_PATH)
+        assert model.num_topics == 32
+        assert model.model is model.model
+
+    def test_cleanup_and_tokenize(self):
+        tokens = TopicModel.cleanup_and_tokenize("I cannot wait, it's gonna be 2 gr8!")
+        assert tokens == ["i", "can", "not", "wait", "it", "s", "gon", "na", "be", "gr"]
+
+    def test_phrasers(self, tmp_path):
+        sentences = [["public", "transport", "cheap"], ["take", "public", "transport"]]
+        path = str(tmp_path / "phraser_bigram")
+        Phrases(sentences, min_count=1, threshold=0.1).freeze().save(path)
+
+        paths = TopicModel.PHRASER_PATHS
+        try:
+            TopicModel.PHRASER_PATHS = (path, str(tmp_path / "missing"))
+            tokens = TopicModel._make_biagrams(["love", "public", "transport"])
+            tagged = TopicModel._make_biagrams(
+                [("public", "JJ"), ("transport", "NN"), ("cheap", "JJ")]
+            )
+        finally:
+            TopicModel.PHRASER_PATHS = paths
+
+        assert tokens == ["love", "public_transport"]
+        assert tagged == [("public_transport", "NN"), ("cheap", "JJ")]
+        assert load_phrasers((str(tmp_path / "missing"),)) == ()
+
+    def test_dictionary_phrases(self):
+        # No phrase models are shipped, the model's own phrases are used
+        assert TopicModel._make_biagrams(["went", "high", "school"]) == [
+            "went",
+            "high_school",
+        ]
+
+        phrasers = phrasers_from_tokens(["book", "a_b", "a_b_c"])
+        words = ["a", "b", "c", "a", "b"]
+
+        for phraser in phrasers:
+            words = phraser[words]
+
+        assert len(phrasers) == 2 and words == ["a_b_c", "a_b"]
+
+    def test_topic_matrix(self):
+        model = TopicModel.shared()
+        docs = [["computer", "system", "user"], ["graph", "trees"], []]
+
+        matrix = model.get_topic_matrix(docs, chunk_size=2)
+
+        assert matrix.shape == (3, model.num_topics)
+        assert numpy.allclose(matrix.sum(axis=1), 1, atol=1e-5)
+        assert numpy.array_equal(matrix[0], model.get_topic_vector(docs[0]))
+        assert model.get_topic_matrix([]).shape == (0, model.num_topics)
+
+    def test_get_topics(self):
+        model = TopicModel.shared()
+        docs = [["computer", "system", "user"], [], ["book", "story"], ["qwzx"]]
+
+        assert model.get_topics(docs) == [model.get_topic(doc) for doc in docs]
+
+    def test_inference_latency(self):
+        model = TopicModel.shared()
+        recorder.enable()
+
+        try:
+            model.get_topic_vector(["book", "story"])
+            assert recorder.stats()["lda.infer.LDA_model_32"]["count"] == 1
+        finally:
+            recorder.disable()
+            recorder.reset()
+
+    def test_gensim_random_state(self):
+        # A private instance, as update changes the model
+        model = TopicModel()
+        docs = [["computer", "system", "user"], ["book", "story"]]
+        before = model.get_topic_matrix(docs)
+
+        assert len(model.model.show_topics(num_topics=5)) == 5
+
+        model.model.update([model._bag_of_words(doc) for doc in docs])
+        assert model.get_topic_matrix(docs).shape == before.shape
+        assert numpy.array_equal(
+            model.get_topic_matrix(docs), model.get_topic_matrix(docs)
+        )
+
+    def test_bag_of_words_uses_model_dictionary(self):
+        model = TopicModel.shared()
+        book = model.model.id2word.token2id["book"]
+
+        bag_of_words = dict(model._bag_of_words(["book", "story", "book", "qwzx"]))
+
+        assert bag_of_words[book] == 2
+        assert len(bag_of_words) == 2
+
+    def test_memory_mapped(self, tmp_path):
+        from tools.convert_lda import convert
+
+        path = str(tmp_path / "LDA_model_32")
+        convert(TopicModel.DEFAULT_PATH, path)
+
+        model = TopicModel(path)
+        assert isinstance(model.model.expElogbeta, numpy.memmap)
+        assert model.num_topics == 32
+        assert model.token2id == TopicModel.shared().token2id
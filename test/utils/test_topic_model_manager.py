@@ -0,0 +1,55 @@
+import os
+import shutil
+
+import pytest
+
+from utils.latency import recorder
+from utils.topic_model import TopicModelException
+from utils.topic_model_manager import TopicModelManager
+
+
+class TestTopicModelManager:
+    def test_available(self):
+        manager = TopicModelManager()
+
+        # LDA_model_33, LDA_model_38 and best_model are pyLDAvis data
+        assert manager.available() == ["LDA_model_32"]
+        assert manager.active_name == "LDA_model_32"
+
+    def test_not_a_model(self):
+        manager = TopicModelManager()
+
+        with pytest.raises(TopicModelException):
+            manager.get("missing")
+
+        # pyLDAvis visualisation data, not an LDA model
+        with pytest.raises(TopicModelException):
+            manager.activate("LDA_model_33")
+
+        assert manager.active_name == "LDA_model_32"
+
+    def test_hot_swap(self, tmp_path):
+        for name in ["a", "b"]:
+            shutil.copy(
+                os.path.join(TopicModelManager.DEFAULT_DIRECTORY, "LDA_model_32"),
+                tmp_path / name,
+            )
+        (tmp_path / "a.html").touch()
+        (tmp_path / "c").write_bytes(b"not a model")
+
+        manager = TopicModelManager(str(tmp_path), active="a")
+        assert manager.available() == ["a", "b"]
+
+        before = manager.active
+        after = manager.activate("b")
+        assert after is manager.active and after is not before
+
+        recorder.enable()
+
+        try:
+            after.get_topic_vector(["book", "story"])
+            report = manager.latency()
+            assert list(report) == ["b"] and report["b"]["count"] == 1
+        finally:
+            recorder.disable()
+            recorder.reset()